@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'NewsPortal.settings')
+# Асинхронные представления страниц чтения (NewsPortal.urls_async)
+os.environ.setdefault('PORTAL_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы замер времени включал остальные слои
+    'news.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,7 +62,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'NewsPortal.urls'
+# Под ASGI (см. asgi.py) страницы чтения портала обслуживаются асинхронными представлениями
+ROOT_URLCONF = 'NewsPortal.urls_async' if os.environ.get('PORTAL_ASYNC_VIEWS') == '1' else 'NewsPortal.urls'
 
 TEMPLATES = [
     {
@@ -88,9 +91,42 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Соединение потока переживает запрос: PRAGMA и открытие файла не повторяются каждый раз
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Выполняются при каждом подключении к SQLite (news.db).
+# WAL: читатели не ждут писателя; synchronous=NORMAL в WAL не теряет целостность при сбое,
+# только последние транзакции при отключении питания; busy_timeout — сколько ждать блокировку, мс
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+# Повторы записи, упавшей с «database is locked», и задержка перед первым из них, с
+SQLITE_WRITE_RETRIES = 5
+SQLITE_WRITE_RETRY_DELAY = 0.02
+
+# default — кэш в памяти процесса для данных, ключ которых меняется вместе с ними (фрагменты статей,
+# проверенные цензурой тексты, готовые ленты). shared — общий для всех процессов сервера и команд:
+# отметки изменений (ETag списков, поколение лент) и сведения о пользователе сбрасываются в одном
+# процессе, а читаются во всех. Таблица shared создаётся миграцией news 0014 (или createcachetable)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'news_cache',
+        # Отметки хранятся без срока, сведения — по записи на пользователя: не вытеснять при 300 записях
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -164,3 +200,48 @@ APSCHEDULER_DATETIME_FORMAT = "N j, Y, f:s a"
 APSCHEDULER_RUN_NOW_TIMEOUT = 25
 
 CURRENT_HOST = 'localhost:8000'
+
+# Буфер голосов: like/dislike копятся в памяти и записываются в базу пачкой
+VOTE_BUFFER_ENABLED = False
+VOTE_BUFFER_MAX_PENDING = 500
+VOTE_BUFFER_FLUSH_INTERVAL = 5
+
+# Списки статей листаются по курсору (created, id) вместо номеров страниц
+POSTS_CURSOR_PAGINATION = True
+
+# Полнотекстовый поиск статей (news.search.LikeSearchBackend для баз без FTS5)
+POST_SEARCH_BACKEND = 'news.search.SqliteFtsSearchBackend'
+
+# Цензура: дополнительный словарь (по слову на строку) и время хранения проверенных текстов в кэше
+CENSOR_WORDS_FILE = os.environ.get('CENSOR_WORDS_FILE')
+CENSOR_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Время хранения отрисованных фрагментов статей
+POST_FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Уведомления подписчикам отправляются пачками через одно SMTP-соединение
+NOTIFICATION_BATCH_SIZE = 100
+
+# Не более POST_LIMIT публикаций автора за POST_LIMIT_WINDOW секунд
+POST_LIMIT = 3
+POST_LIMIT_WINDOW = 24 * 60 * 60
+
+# Время хранения в кэше сведений о пользователе (группа авторов, подписки)
+PROFILE_FACTS_CACHE_TIMEOUT = 60 * 60
+
+# Замеры запросов (/metrics): запросы сверх бюджета пишутся в журнал news.metrics вместе с SQL
+REQUEST_QUERY_BUDGET = 30
+REQUEST_TIME_BUDGET = 0.5
+# Адреса, которым доступен /metrics без входа
+INTERNAL_IPS = ['127.0.0.1']
+
+# Ленты RSS/Atom: число статей и время хранения готового документа в кэше
+FEED_ITEMS = 20
+FEED_CACHE_TIMEOUT = 24 * 60 * 60
+
+# JSON API: размер страницы по умолчанию и наибольший (параметр limit)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Лента категории хранит не больше стольких последних статей; глубже лента подписок не листается
+TIMELINE_RETENTION = 1000
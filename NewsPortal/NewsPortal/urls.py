@@ -16,6 +16,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic.base import RedirectView
+from news.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,4 +26,5 @@ urlpatterns = [
     path('portal/logout/', include('sign.urls')),
     path('portal/sign/', include('sign.urls')),
     path('portal/', include('news.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
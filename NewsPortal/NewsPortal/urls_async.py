@@ -0,0 +1,11 @@
+"""
+URL-схема для запуска под ASGI (см. asgi.py): страницы чтения портала обслуживаются
+асинхронными представлениями, все остальные адреса — как в NewsPortal.urls
+"""
+from django.urls import path, include
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('portal/', include('news.urls_async')),
+] + sync_urlpatterns
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Category, Post, PostCategory
+from .models import Category, Post, PostCategory, PostNotification
 
 # Register your models here.
 admin.site.register(Category)
 admin.site.register(Post)
 admin.site.register(PostCategory)
+admin.site.register(PostNotification)
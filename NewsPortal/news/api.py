@@ -0,0 +1,211 @@
+"""
+JSON API только для чтения: статьи, их комментарии и категории (/portal/api/...).
+Строки выбираются values(), объекты моделей не создаются; полный текст статьи читается только
+по запросу поля content. Поля ответа выбираются параметром fields (через запятую), списки
+постраничные по курсору (cursor, limit), фильтры статей — те же, что у PostFilter.
+Заголовки и тексты проходят цензуру, как на страницах портала.
+JSON кодируется orjson, если он установлен, иначе стандартным json.
+"""
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from .censor import get_censor
+from .filters import PostFilter
+from .models import Category, Comment, Post, PostCategory
+from .pagination import CursorPaginator, InvalidCursor
+from .views import PostsListSearch
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Поле ответа -> поле для values(); categories выбираются отдельно
+POST_FIELDS = {
+    'id': 'id',
+    'type': 'type',
+    'title': 'title',
+    'author': 'author__user__username',
+    'rating': 'rating',
+    'comment_count': 'comment_count',
+    'created': 'created',
+    'modified': 'modified',
+    'content': 'content',
+    'preview': 'preview',
+    'categories': None,
+}
+POST_LIST_FIELDS = ('id', 'type', 'title', 'author', 'rating', 'comment_count', 'created', 'preview', 'categories')
+POST_DETAIL_FIELDS = ('id', 'type', 'title', 'author', 'rating', 'comment_count', 'created', 'modified', 'content',
+                      'categories')
+
+COMMENT_FIELDS = {
+    'id': 'id',
+    'user': 'user__username',
+    'content': 'content',
+    'rating': 'rating',
+    'created': 'created',
+}
+
+# Поля, которые отдаются после цензуры
+CENSORED_FIELDS = ('title', 'preview', 'content')
+
+POSTS_ORDERING = ('-created', '-id')
+COMMENTS_ORDERING = ('created', 'id')
+
+
+class ApiError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_default).encode()
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def api_view(login_required=False):
+    """
+    GET-представление API: ошибки (ApiError, неверный курсор) отдаются JSON-ом
+    """
+    def decorator(view):
+        @require_GET
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                if login_required and not request.user.is_authenticated:
+                    raise ApiError(401, 'Authentication required')
+                return json_response(view(request, *args, **kwargs))
+            except ApiError as e:
+                return json_response({'detail': str(e)}, e.status)
+            except InvalidCursor:
+                return json_response({'detail': 'Invalid cursor'}, 400)
+        return wrapper
+    return decorator
+
+
+def selected_fields(request, available, default):
+    names = [name for name in request.GET.get('fields', '').split(',') if name]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(400, f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(available)}')
+    return names or list(default)
+
+
+def page_size(request):
+    maximum = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+    try:
+        return max(1, min(maximum, int(request.GET.get('limit', getattr(settings, 'API_PAGE_SIZE', 20)))))
+    except ValueError:
+        raise ApiError(400, 'limit must be a number')
+
+
+def value_rows(queryset, spec, fields, extra=()):
+    """
+    values() с полями fields из spec и служебными extra (ключ сортировки)
+    """
+    return queryset.values(*{spec[name] for name in fields if spec[name]}, 'id', *extra)
+
+
+def project(rows, spec, fields):
+    return [{name: row[spec[name] or name] for name in fields} for row in rows]
+
+
+def censor_rows(rows, spec, fields):
+    """
+    Текстовые поля проходят ту же цензуру, что и на страницах портала
+    """
+    censor = get_censor()
+    columns = [spec[name] for name in CENSORED_FIELDS if name in fields]
+    for row in rows:
+        for column in columns:
+            row[column] = censor(row[column])
+    return rows
+
+
+def paginated(request, queryset, ordering, projection):
+    paginator = CursorPaginator(queryset, page_size(request), ordering)
+    page = paginator.page(request.GET.get('cursor'))
+    return {
+        'results': projection(page.object_list),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def post_projection(fields):
+    """
+    Строки values() -> словари с полями fields, категории одним запросом
+    """
+    def project_posts(rows):
+        if 'categories' in fields:
+            categories = defaultdict(list)
+            links = (PostCategory.objects.filter(post_id__in=[row['id'] for row in rows]).order_by('category_id')
+                     .values_list('post_id', 'category_id', 'category__name'))
+            for post_id, category_id, name in links:
+                categories[post_id].append({'id': category_id, 'name': name})
+            for row in rows:
+                row['categories'] = categories[row['id']]
+        return project(censor_rows(rows, POST_FIELDS, fields), POST_FIELDS, fields)
+    return project_posts
+
+
+@api_view(login_required=True)
+def posts(request):
+    fields = selected_fields(request, POST_FIELDS, POST_LIST_FIELDS)
+    queryset = Post.objects.all()
+    ordering = POSTS_ORDERING
+    if set(request.GET) & set(PostFilter.base_filters):
+        # Фильтры доступны тем же, кому страница поиска
+        if not request.user.has_perms(PostsListSearch.permission_required):
+            raise ApiError(403, 'Permission denied')
+        filterset = PostFilter(request.GET, queryset)
+        if not filterset.is_valid():
+            raise ApiError(400, filterset.form.errors.as_json())
+        queryset = filterset.qs
+        if filterset.form.cleaned_data.get('q'):
+            ordering = ('search_rank', 'id')
+    extra = [name.lstrip('-') for name in ordering]
+    return paginated(request, value_rows(queryset, POST_FIELDS, fields, extra), ordering, post_projection(fields))
+
+
+@api_view()
+def post_detail(request, id):
+    fields = selected_fields(request, POST_FIELDS, POST_DETAIL_FIELDS)
+    rows = list(value_rows(Post.objects.filter(pk=id), POST_FIELDS, fields))
+    if not rows:
+        raise ApiError(404, 'Post not found')
+    return post_projection(fields)(rows)[0]
+
+
+@api_view(login_required=True)
+def post_comments(request, id):
+    if not Post.objects.filter(pk=id).exists():
+        raise ApiError(404, 'Post not found')
+    fields = selected_fields(request, COMMENT_FIELDS, COMMENT_FIELDS)
+    queryset = value_rows(Comment.objects.filter(post_id=id), COMMENT_FIELDS, fields, ('created',))
+    return paginated(request, queryset, COMMENTS_ORDERING,
+                     lambda rows: project(censor_rows(rows, COMMENT_FIELDS, fields), COMMENT_FIELDS, fields))
+
+
+@api_view()
+def categories(request):
+    return {'results': list(Category.objects.order_by('name').values('id', 'name'))}
@@ -6,5 +6,6 @@ class NewsConfig(AppConfig):
     name = 'news'
 
     def ready(self):
+        import news.db
         import news.signals
 
@@ -0,0 +1,141 @@
+"""
+Асинхронные версии страниц чтения портала (список, поиск, статья) для запуска под ASGI.
+Подключаются схемой NewsPortal.urls_async. Данные читаются асинхронным ORM, поэтому
+медленный клиент не занимает поток; шаблоны получают уже загруженные объекты.
+Ответы — TemplateResponse: Django отрисовывает их в потоке, а news.metrics засекает время отрисовки.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import get_user
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.views import View
+
+from .filters import PostFilter
+from .models import Post, Category
+from .pagination import CursorPaginator
+from .profile import aget_profile_facts
+from .views import PostsList, PostsListSearch, NewsDetail, category_ids, comments_paginator
+from . import conditional
+
+
+async def aget_user(request):
+    """
+    Пользователь сессии. Загружается в потоке для синхронного кода и запоминается в запросе,
+    после чего request.user (в том числе в шаблонах) не обращается к базе
+    """
+    return await sync_to_async(get_user)(request)
+
+
+async def paginate(request, queryset, per_page, ordering):
+    """
+    Контекст страницы списка, как у ListView с CursorPaginationMixin
+    """
+    if getattr(settings, 'POSTS_CURSOR_PAGINATION', True):
+        paginator = CursorPaginator(queryset, per_page, ordering)
+        page = await paginator.apage(request.GET.get('cursor'))
+    else:
+        paginator = Paginator(queryset.order_by(*ordering), per_page)
+        page = await sync_to_async(paginator.get_page)(request.GET.get('page'))
+        page.object_list = [post async for post in page.object_list]
+    return {
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        'object_list': page.object_list,
+        'posts': page.object_list,
+        'cursor_pagination': isinstance(paginator, CursorPaginator),
+    }
+
+
+async def list_etag(request, queryset):
+    last_modified = (await queryset.order_by().aaggregate(last=Max('modified')))['last']
+    return conditional.list_etag(request, last_modified, await conditional.aposts_changed_at(),
+                                 await aget_profile_facts(request.user))
+
+
+class AsyncPostsList(View):
+    template_name = PostsList.template_name
+    paginate_by = PostsList.paginate_by
+
+    async def get(self, request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+
+        queryset = Post.objects.order_by('created').for_list()
+        etag = await list_etag(request, queryset)
+        response = conditional.not_modified(request, etag)
+        if response is None:
+            context = await paginate(request, queryset, self.paginate_by, PostsList.cursor_ordering)
+            context['is_not_premium'] = not (await aget_profile_facts(user)).is_author
+            response = TemplateResponse(request, self.template_name, context)
+        return conditional.add_validators(request, response, etag)
+
+
+class AsyncPostsListSearch(View):
+    template_name = PostsListSearch.template_name
+    paginate_by = PostsListSearch.paginate_by
+    permission_required = PostsListSearch.permission_required
+
+    async def get(self, request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if not await sync_to_async(user.has_perms)(self.permission_required):
+            raise PermissionDenied
+
+        # Проверка формы фильтра читает категории, поэтому идёт в потоке для синхронного кода
+        filterset = PostFilter(request.GET, Post.objects.order_by('created').for_list())
+        queryset = await sync_to_async(lambda: filterset.qs)()
+        ordering = PostsListSearch.cursor_ordering
+        if filterset.is_valid() and filterset.form.cleaned_data.get('q'):
+            ordering = ('search_rank', 'id')
+
+        etag = await list_etag(request, queryset)
+        response = conditional.not_modified(request, etag)
+        if response is None:
+            context = await paginate(request, queryset, self.paginate_by, ordering)
+            context['filterset'] = filterset
+            context['current_user'] = user
+            context['cat_not_sub'], context['cat_sub'] = await self.categories_by_subscription(request.GET, user)
+            # Поля формы фильтра выбирают варианты из базы при отрисовке: TemplateResponse
+            # отрисовывается обработчиком Django в потоке
+            response = TemplateResponse(request, self.template_name, context)
+        return conditional.add_validators(request, response, etag)
+
+    @staticmethod
+    async def categories_by_subscription(get_params, user):
+        cat_filter = category_ids(get_params)
+        if not cat_filter:
+            return [], []
+        subscribed = (await aget_profile_facts(user)).subscribed_categories
+        categories = [cat async for cat in Category.objects.filter(id__in=cat_filter).order_by('id')]
+        return ([cat for cat in categories if cat.id not in subscribed],
+                [cat for cat in categories if cat.id in subscribed])
+
+
+class AsyncNewsDetail(View):
+    template_name = NewsDetail.template_name
+
+    async def get(self, request, id, *args, **kwargs):
+        validators = await Post.objects.filter(pk=id).values_list('modified', 'revision').afirst()
+        if validators is None:
+            raise Http404('No post found matching the query')
+        cursor = request.GET.get('comments')
+        etag, last_modified = conditional.detail_etag(id, *validators, cursor), validators[0]
+
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is None:
+            try:
+                post = await Post.objects.select_related('author__user').aget(pk=id)
+            except Post.DoesNotExist:
+                raise Http404('No post found matching the query')
+            comments = await comments_paginator(post, NewsDetail.comments_per_page).apage(cursor)
+            response = TemplateResponse(request, self.template_name,
+                                        {'post': post, 'object': post, 'comments': comments})
+        return conditional.add_validators(request, response, etag, last_modified)
@@ -0,0 +1,657 @@
+"""
+Сценарии замеров производительности для команды benchmark.
+Сценарий — функция, принимающая параметры команды и возвращающая словарь результатов.
+"""
+import asyncio
+import io
+import os
+import random
+import socketserver
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import ASGIHandler
+from django.core.cache import cache, caches
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.wsgi import WSGIHandler
+from django.db import connection, transaction, close_old_connections, OperationalError
+from django.db.models import Count, Value
+from django.db.models.functions import Concat
+from django.template.loader import render_to_string
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import Author, Category, Post, PostCategory, Comment, SubscribersOfNews
+from . import api, notifications, ratelimit
+from .management.commands.sendemail import send_email_to_subscribers
+from .pagination import CursorPaginator, NEXT
+from .views import PostsList
+from .seed import seed_portal
+from .db import retry_on_locked
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+class Timer:
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Минимальный SMTP-сервер: принимает и отбрасывает письма, считая их
+    """
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 sink ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.reply('250-sink')
+                self.reply('250 SIZE 0')
+            elif command == b'DATA':
+                self.reply('354 end with .')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.received += 1
+                self.reply('250 queued')
+            elif command == b'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.lock = threading.Lock()
+        self.received = 0
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+    def connection(self):
+        host, port = self.server_address
+        return get_connection('django.core.mail.backends.smtp.EmailBackend', host=host, port=port,
+                              username='', password='', use_tls=False, use_ssl=False)
+
+
+@scenario('notify_smtp')
+def notify_smtp(size=None, **options):
+    """
+    Рассылка уведомления о статье size подписчикам через локальный SMTP-сервер:
+    прежний способ (отрисовка и соединение на каждое письмо) против пакетной отправки
+    """
+    size = size or 10_000
+    post = Post(id=1, title='Benchmark', content='Benchmark post ' * 50)
+    recipients = [(f'user{i}', f'user{i}@example.com') for i in range(size)]
+    # Прежний способ слишком медленный для полного прогона, его скорость оценивается по части получателей
+    naive_size = min(size, 200)
+
+    with SMTPSink() as sink:
+        with Timer() as naive:
+            for username, email in recipients[:naive_size]:
+                html_content = render_to_string('news_create_email.html', {'post': post, 'domain': 'localhost'})
+                msg = EmailMultiAlternatives(subject='Benchmark', body='', from_email='', to=[email],
+                                             connection=sink.connection())
+                msg.attach_alternative(html_content + notifications.greeting(username), "text/html")
+                msg.send()
+
+        with Timer() as batched:
+            sent = notifications.send_post_notification(post, 'Benchmark', recipients, sink.connection())
+
+    return {
+        'subscribers': size,
+        'per_message_msgs_per_sec': round(naive_size / naive.seconds, 1),
+        'batched_msgs_per_sec': round(sent / batched.seconds, 1),
+        'batched_seconds': round(batched.seconds, 3),
+        'received': sink.received,
+    }
+
+
+def hot_queries():
+    """
+    Запросы, для которых добавлялись индексы
+    """
+    now = timezone.now()
+    return {
+        'list_first_page': Post.objects.order_by('created', 'id')[:4],
+        'list_next_page': Post.objects.filter(
+            CursorPaginator._after(('created', 'id'), (now, 1))).order_by('created', 'id')[:4],
+        'post_limit': Post.objects.filter(author_id=1, created__gte=now).order_by()[:3],
+        'category_filter': Post.objects.filter(postcategory__category=1).order_by('created', 'id')[:4],
+        'post_comments': Comment.objects.filter(post_id=1).order_by('created', 'id')[:20],
+    }
+
+
+@scenario('query_plans')
+def query_plans(**options):
+    """
+    Планы горячих запросов с индексами и без них.
+    Индексы удаляются в транзакции, которая затем откатывается: SQLite поддерживает транзакционный DDL.
+    """
+    # SQLite кэширует подготовленные EXPLAIN, поэтому каждый этап идёт в новом соединении
+    connection.close()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for model in (Post, PostCategory, Comment):
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX IF EXISTS "{index.name}"')
+        without_indexes = {name: queryset.explain() for name, queryset in hot_queries().items()}
+        transaction.set_rollback(True)
+
+    connection.close()
+    with_indexes = {name: queryset.explain() for name, queryset in hot_queries().items()}
+
+    return {
+        name: {'before': without_indexes[name], 'after': with_indexes[name]}
+        for name in with_indexes
+    }
+
+
+def latency_stats(latencies, seconds, errors):
+    latencies = sorted(latencies)
+
+    def percentile(fraction):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 1)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_sec': round(len(latencies) / seconds, 1),
+        'p50_ms': percentile(0.5),
+        'p99_ms': percentile(0.99),
+    }
+
+
+def session_cookie():
+    """
+    Cookie сессии пользователя с наибольшими правами, чтобы открывались и списки статей
+    """
+    user = User.objects.filter(is_active=True).order_by('-is_superuser', 'pk').first()
+    if user is None:
+        return ''
+    client = Client()
+    client.force_login(user)
+    return f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+
+def wsgi_environ(path, cookie):
+    path, _, query = path.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost', 'HTTP_COOKIE': cookie, 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+
+
+def asgi_scope(path, cookie):
+    path, _, query = path.partition('?')
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+
+
+def load_wsgi(paths, cookie, clients, requests, delay, threads):
+    """
+    WSGI-сервер с пулом из threads потоков (как gunicorn gthread): пока медленный клиент
+    дочитывает ответ, поток занят
+    """
+    handler = WSGIHandler()
+    latencies, errors = [], []
+
+    def serve(path):
+        statuses = []
+        response = handler(wsgi_environ(path, cookie), lambda status, headers, exc_info=None: statuses.append(status))
+        try:
+            for _ in response:
+                pass
+            time.sleep(delay)
+        finally:
+            response.close()
+        return statuses[0]
+
+    with ThreadPoolExecutor(threads) as workers:
+        def client(number):
+            for i in range(number, requests, clients):
+                started = time.perf_counter()
+                status = workers.submit(serve, paths[i % len(paths)]).result()
+                latencies.append(time.perf_counter() - started)
+                if not status.startswith('200'):
+                    errors.append(status)
+
+        with Timer() as timer, ThreadPoolExecutor(clients) as pool:
+            list(pool.map(client, range(clients)))
+    return latency_stats(latencies, timer.seconds, len(errors))
+
+
+def load_asgi(paths, cookie, clients, requests, delay):
+    """
+    ASGI с асинхронными представлениями: медленный клиент ждёт в цикле событий, не занимая поток
+    """
+    handler = ASGIHandler()
+    latencies, errors = [], []
+
+    async def serve(path):
+        statuses = []
+        body = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if body:
+                return body.pop()
+            # Клиент не отключается
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+            elif not message.get('more_body'):
+                await asyncio.sleep(delay)
+
+        await handler(asgi_scope(path, cookie), receive, send)
+        return statuses[0]
+
+    async def client(number):
+        for i in range(number, requests, clients):
+            started = time.perf_counter()
+            status = await serve(paths[i % len(paths)])
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+
+    async def run():
+        await asyncio.gather(*(client(number) for number in range(clients)))
+
+    with Timer() as timer:
+        asyncio.run(run())
+    return latency_stats(latencies, timer.seconds, len(errors))
+
+
+@scenario('slow_clients')
+def slow_clients(size=None, clients=100, client_delay=0.05, threads=8, **options):
+    """
+    Нагрузка страницами чтения (статьи, список, поиск) от clients одновременных медленных клиентов:
+    синхронные представления под WSGI против асинхронных под ASGI
+    """
+    requests = size or 1000
+    post_ids = list(Post.objects.order_by('-id').values_list('id', flat=True)[:20])
+    if not post_ids:
+        return {'skipped': 'no posts in the database'}
+    cookie = session_cookie()
+    paths = [f'/portal/{pk}' for pk in post_ids]
+    if cookie:
+        paths += ['/portal/', '/portal/search/']
+
+    with override_settings(ROOT_URLCONF='NewsPortal.urls'):
+        wsgi = load_wsgi(paths, cookie, clients, requests, client_delay, threads)
+    with override_settings(ROOT_URLCONF='NewsPortal.urls_async'):
+        asgi = load_asgi(paths, cookie, clients, requests, client_delay)
+
+    return {
+        'clients': clients,
+        'client_delay_ms': client_delay * 1000,
+        'wsgi_threads': threads,
+        'wsgi': wsgi,
+        'asgi': asgi,
+    }
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Отдельная база для замеров: создаётся как тестовая (с миграциями) и удаляется после.
+    Файл, а не память, как у тестовой базы SQLite по умолчанию: миллион статей в память не помещается.
+    """
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    saved_name = test_settings.get('NAME')
+    test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'news_benchmark.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = saved_name
+
+
+def measure(action, repeat):
+    """
+    Медиана и минимум времени выполнения (кэши каждый раз очищаются) и число запросов к базе
+    """
+    timings = []
+    for _ in range(repeat):
+        cache.clear()
+        caches['shared'].clear()
+        with CaptureQueriesContext(connection) as queries, Timer() as timer:
+            action()
+        timings.append(timer.seconds)
+    return {
+        'seconds': round(statistics.median(timings), 4),
+        'min_seconds': round(min(timings), 4),
+        'queries': len(queries),
+    }
+
+
+def rolled_back(action):
+    """
+    Изменяющие данные пути выполняются в откатываемой транзакции, чтобы повторы были одинаковыми
+    """
+    def run():
+        with transaction.atomic():
+            action()
+            transaction.set_rollback(True)
+    return run
+
+
+def request(client, method, url, expected_status, **params):
+    def run():
+        response = getattr(client, method)(url, params)
+        if response.status_code != expected_status:
+            raise RuntimeError(f'{method.upper()} {url}: {response.status_code}, expected {expected_status}')
+    return run
+
+
+def portal_paths():
+    """
+    Пути портала, которые замеряются на сгенерированных данных
+    """
+    user = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+    # testserver разрешён только под тестовым окружением
+    client = Client(SERVER_NAME='localhost')
+    client.force_login(user)
+
+    post_id = Post.objects.order_by('-id').values_list('pk', flat=True).first()
+    middle = Post.objects.filter(pk__gte=post_id // 2).order_by('pk').first()
+    deep_cursor = CursorPaginator(Post.objects.all(), PostsList.paginate_by).encode_cursor(middle, NEXT)
+    api_deep_cursor = CursorPaginator(Post.objects.all(), 20, api.POSTS_ORDERING).encode_cursor(middle, NEXT)
+    category_id = Category.objects.values_list('pk', flat=True).first()
+    SubscribersOfNews.objects.bulk_create([
+        SubscribersOfNews(user=user, category_id=pk) for pk in Category.objects.values_list('pk', flat=True)[:3]
+    ])
+
+    def subscription_join():
+        # Как до лент категорий: соединение статей с подписками при чтении
+        list(Post.objects.for_list().filter(postcategory__category__subscribers=user).distinct()
+             .order_by('-created', '-id')[:10])
+    author_id = Author.objects.values_list('pk', flat=True).first()
+
+    # Обсуждаемая статья: на странице выводится только первая страница её комментариев
+    Comment.objects.bulk_create([
+        Comment(post=middle, user=user, content=f'Benchmark comment {i}') for i in range(2000)
+    ])
+    Post.objects.filter(pk=middle.pk).recount_comments()
+
+    def comment_counts_aggregate():
+        # Как до Post.comment_count: подсчёт комментариев при чтении списка
+        list(Post.objects.for_list().annotate(comments=Count('comment')).order_by('-created', '-id')[:10])
+
+    def create():
+        with ratelimit.suppressed():
+            request(client, 'post', '/portal/news/create/', 302, author=author_id, category=[category_id],
+                    title='Benchmark post', content='Benchmark content ' * 30)()
+
+    return {
+        'list_first_page': request(client, 'get', '/portal/', 200),
+        'list_deep_page': request(client, 'get', '/portal/', 200, cursor=deep_cursor),
+        'search': request(client, 'get', '/portal/search/', 200, q='технологии'),
+        'search_category': request(client, 'get', '/portal/search/', 200, category=category_id),
+        'detail': request(client, 'get', f'/portal/{post_id}', 200),
+        'detail_discussed': request(client, 'get', f'/portal/{middle.pk}', 200),
+        'comment_counts_aggregate': comment_counts_aggregate,
+        'subscription_feed': request(client, 'get', '/portal/my/', 200),
+        'subscription_join': subscription_join,
+        # Те же данные через JSON API
+        'api_list_first_page': request(client, 'get', '/portal/api/posts/', 200),
+        'api_list_deep_page': request(client, 'get', '/portal/api/posts/', 200, cursor=api_deep_cursor),
+        'api_search': request(client, 'get', '/portal/api/posts/', 200, q='технологии'),
+        'api_detail': request(client, 'get', f'/portal/api/posts/{post_id}/', 200),
+        'create': rolled_back(create),
+        'recompute_ratings': rolled_back(Author.objects.recompute_ratings),
+        'weekly_digest': rolled_back(send_email_to_subscribers),
+    }
+
+
+@scenario('portal')
+def portal(size=None, sizes=None, repeat=5, **options):
+    """
+    Время и число запросов основных путей портала (список, поиск, статья, создание,
+    пересчёт рейтингов, еженедельная сводка) на сгенерированных данных разного объёма
+    """
+    results = {}
+    for posts in sizes or [size or 1000]:
+        with benchmark_database(), \
+                override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            with Timer() as seeding:
+                counts = seed_portal(posts)
+            results[str(posts)] = {
+                'seed_seconds': round(seeding.seconds, 1),
+                'rows': counts,
+                'paths': {name: measure(action, repeat) for name, action in portal_paths().items()},
+            }
+    return results
+
+
+# Настройки SQLite по умолчанию, как до news.db: журнал отката, полная синхронизация, без mmap
+DEFAULT_SQLITE_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'mmap_size': 0, 'busy_timeout': 5000}
+
+
+def read_list(pk):
+    list(Post.objects.order_by('-created').for_list()[:PostsList.paginate_by])
+
+
+def read_detail(pk):
+    Post.objects.select_related('author__user').get(pk=pk)
+
+
+def vote(pk):
+    Post.apply_rating_deltas({pk: 1})
+
+
+@retry_on_locked
+def edit(pk):
+    """
+    Как PostEdit: прочитать статью и сохранить её в одной транзакции
+    """
+    with transaction.atomic():
+        post = Post.objects.get(pk=pk)
+        post.title = post.title[:100]
+        post.save()
+
+
+def mixed_load(post_ids, threads, seconds, write_share):
+    """
+    threads потоков в течение seconds секунд читают и пишут вперемешку; каждая операция — как
+    отдельный запрос: до и после неё соединения закрываются по CONN_MAX_AGE
+    """
+    latencies = {'reads': [], 'writes': []}
+    errors = {'reads': 0, 'writes': 0}
+    deadline = time.monotonic() + seconds
+
+    def worker(number):
+        rng = random.Random(number)
+        try:
+            while time.monotonic() < deadline:
+                kind = 'writes' if rng.random() < write_share else 'reads'
+                action = rng.choice((vote, edit) if kind == 'writes' else (read_list, read_detail))
+                close_old_connections()
+                started = time.perf_counter()
+                try:
+                    action(rng.choice(post_ids))
+                except OperationalError:
+                    errors[kind] += 1
+                else:
+                    latencies[kind].append(time.perf_counter() - started)
+                close_old_connections()
+        finally:
+            connection.close()
+
+    with Timer() as timer, ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return {kind: latency_stats(latencies[kind], timer.seconds, errors[kind]) for kind in latencies}
+
+
+@contextmanager
+def sqlite_setup(pragmas, conn_max_age, retries):
+    """
+    Режим журнала меняется, только когда других соединений нет, поэтому первым подключается
+    основной поток, до запуска нагрузки
+    """
+    saved_max_age = connection.settings_dict['CONN_MAX_AGE']
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    try:
+        with override_settings(SQLITE_PRAGMAS=pragmas, SQLITE_WRITE_RETRIES=retries):
+            connection.close()
+            connection.ensure_connection()
+            yield
+            connection.close()
+    finally:
+        connection.settings_dict['CONN_MAX_AGE'] = saved_max_age
+
+
+@scenario('sqlite_concurrency')
+def sqlite_concurrency(size=None, threads=8, duration=5, write_share=0.2, **options):
+    """
+    Пропускная способность одновременных чтений и записей на SQLite-файле: настройки по умолчанию
+    (журнал отката, соединение на запрос, без повторов) против SQLITE_PRAGMAS, постоянных соединений
+    и повторов записи
+    """
+    results = {'threads': threads, 'seconds': duration, 'write_share': write_share}
+    with benchmark_database():
+        seed_portal(size or 1000)
+        post_ids = list(Post.objects.values_list('pk', flat=True))
+        setups = {
+            'default': (DEFAULT_SQLITE_PRAGMAS, 0, 0),
+            'tuned': (settings.SQLITE_PRAGMAS, settings.DATABASES['default'].get('CONN_MAX_AGE', 0),
+                      settings.SQLITE_WRITE_RETRIES),
+        }
+        for name, setup in setups.items():
+            with sqlite_setup(*setup):
+                results[name] = mixed_load(post_ids, threads, duration, write_share)
+    return results
+
+
+def full_rows(limit):
+    # Как до Post.preview и Post.category_labels: полный текст и категории для каждой статьи
+    posts = (Post.objects.select_related('author__user').prefetch_related('category')
+             .order_by('-created', '-id')[:limit])
+    return posts, lambda post: (Post.preview_of(post.content), ', '.join(c.name for c in post.category.all()))
+
+
+def stored_columns(limit):
+    posts = Post.objects.for_list().order_by('-created', '-id')[:limit]
+    return posts, lambda post: (post.preview, post.category_labels)
+
+
+def fetched_bytes(queryset):
+    """
+    Объём данных, которые SQLite отдаёт по основному запросу выборки
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return sum(len(value.encode()) if isinstance(value, str) else 8 for row in cursor for value in row)
+
+
+def list_rows(select, limit, repeat):
+    """
+    Время, пик памяти Python (tracemalloc) и прочитанные байты для limit статей списка
+    """
+    timings = []
+    for _ in range(repeat):
+        posts, row = select(limit)
+        with Timer() as timer:
+            rows = [row(post) for post in posts]
+        timings.append(timer.seconds)
+    # Отдельным проходом: трассировка памяти замедляет выполнение
+    posts, row = select(limit)
+    tracemalloc.start()
+    rows = [row(post) for post in posts]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'seconds': round(statistics.median(timings), 4),
+        'peak_memory_kb': round(peak / 1024),
+        'fetched_kb': round(fetched_bytes(select(limit)[0]) / 1024),
+        'rows': len(rows),
+    }
+
+
+@scenario('list_columns')
+def list_columns(size=None, repeat=5, article_kb=20, **options):
+    """
+    Списки статей с длинным текстом (article_kb килобайт): полный текст с preview и категориями,
+    вычисляемыми при отрисовке, против сохранённых preview и category_labels без текста
+    """
+    results = {'article_kb': article_kb}
+    with benchmark_database():
+        seed_portal(size or 2000)
+        filler = (' Long article text.' * article_kb * 1024)[:article_kb * 1024]
+        Post.objects.update(content=Concat('content', Value(filler)))
+        for name, limit in (('list_page', PostsList.paginate_by), ('all_posts', None)):
+            results[name] = {
+                'full_rows': list_rows(full_rows, limit, repeat),
+                'stored_columns': list_rows(stored_columns, limit, repeat),
+            }
+    return results
+
+
+def compare_results(baseline, current, tolerance=0.2):
+    """
+    Регрессии относительно сохранённых результатов: время выросло больше чем на tolerance
+    либо изменилось число запросов
+    """
+    regressions = []
+
+    def walk(before, after, path):
+        if isinstance(after, dict):
+            for key, value in after.items():
+                if isinstance(before, dict) and key in before:
+                    walk(before[key], value, path + [key])
+        elif path[-1] == 'seconds' and before and after > before * (1 + tolerance):
+            regressions.append(f'{".".join(path)}: {before} -> {after} s')
+        elif path[-1] == 'queries' and after != before:
+            regressions.append(f'{".".join(path)}: {before} -> {after} queries')
+
+    walk(baseline, current, [])
+    return regressions
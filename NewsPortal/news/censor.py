@@ -0,0 +1,77 @@
+"""
+Цензура нецензурных слов.
+Словарь компилируется один раз в регулярное выражение по префиксному дереву слов,
+поэтому текст проверяется за один проход без учёта регистра при любом размере словаря.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+SWEAR_WORDS = [
+    'ругань1',
+    'ругань2',
+    'ругань3',
+]
+
+MASK = '****'
+
+
+def load_words(path):
+    """
+    Слова из файла словаря: по одному на строку, строки с # пропускаются
+    """
+    with open(path, encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip() and not line.lstrip().startswith('#')]
+
+
+def trie_pattern(words):
+    """
+    Регулярное выражение, совпадающее с любым из слов.
+    Общие префиксы слов выносятся за скобки, поэтому проверка каждой позиции текста
+    стоит не дороже длины самого длинного слова, а не размера словаря.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word.lower():
+            node = node.setdefault(char, {})
+        node[''] = True
+    return _node_pattern(trie)
+
+
+def _node_pattern(node):
+    is_word = '' in node
+    branches = [re.escape(char) + _node_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    if len(branches) == 1 and (not is_word or len(branches[0]) == 1):
+        pattern = branches[0]
+    else:
+        pattern = f'(?:{"|".join(branches)})'
+    return f'{pattern}?' if is_word else pattern
+
+
+class Censor:
+
+    def __init__(self, words, mask=MASK):
+        self.mask = mask
+        words = [word for word in words if word]
+        self.pattern = re.compile(trie_pattern(words), re.IGNORECASE) if words else None
+
+    def __call__(self, text):
+        if self.pattern is None or not text:
+            return text
+        return self.pattern.sub(self.mask, text)
+
+
+@lru_cache(maxsize=None)
+def get_censor():
+    """
+    Цензор по словарю SWEAR_WORDS и файлу CENSOR_WORDS_FILE из настроек
+    """
+    words = list(SWEAR_WORDS)
+    path = getattr(settings, 'CENSOR_WORDS_FILE', None)
+    if path:
+        words += load_words(path)
+    return Censor(words)
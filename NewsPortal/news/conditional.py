@@ -0,0 +1,121 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для страниц статей.
+Валидаторы считаются лёгкими запросами до выборки и отрисовки страницы,
+клиенту с актуальной копией отвечаем 304.
+"""
+import hashlib
+from calendar import timegm
+
+from django.core.cache import caches
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+
+from .models import Post
+from .profile import get_profile_facts
+
+POSTS_CHANGED_KEY = 'posts-changed-at'
+
+
+def mark_posts_changed():
+    """
+    Время последнего сохранения или удаления статьи или изменения её категорий.
+    Статья, которая после изменения перестала подходить под фильтр списка (или удалена),
+    не входит в последнее изменение отобранных статей, поэтому оно запоминается отдельно
+    (в общем кэше: статьи меняют и другие процессы, и команды загрузки)
+    """
+    caches['shared'].set(POSTS_CHANGED_KEY, timezone.now().isoformat(), None)
+
+
+def posts_changed_at():
+    return caches['shared'].get(POSTS_CHANGED_KEY, '')
+
+
+async def aposts_changed_at():
+    return await caches['shared'].aget(POSTS_CHANGED_KEY, '')
+
+
+def post_validators(request, id):
+    """
+    (время изменения, редакция) статьи одним запросом, запоминается на время запроса
+    """
+    if not hasattr(request, '_post_validators'):
+        request._post_validators = Post.objects.filter(pk=id).values_list('modified', 'revision').first()
+    return request._post_validators
+
+
+def detail_etag(id, modified, revision, comments_cursor=None):
+    """
+    comments_cursor: страница комментариев (параметр comments) тоже входит в ETag
+    """
+    etag = f'{id}-{revision}-{modified.timestamp():.6f}'
+    if comments_cursor:
+        etag += '-' + hashlib.md5(comments_cursor.encode()).hexdigest()[:12]
+    return etag
+
+
+def post_etag(request, id, **kwargs):
+    validators = post_validators(request, id)
+    return detail_etag(id, *validators, request.GET.get('comments')) if validators else None
+
+
+def post_last_modified(request, id, **kwargs):
+    validators = post_validators(request, id)
+    return validators[0] if validators else None
+
+
+post_condition = condition(etag_func=post_etag, last_modified_func=post_last_modified)
+
+
+def list_etag(request, last_modified, posts_changed, facts):
+    """
+    ETag списка: последнее изменение среди отобранных статей, время последнего изменения любой статьи
+    (posts_changed_at), параметры запроса и сведения о пользователе, от которых зависит страница
+    """
+    parts = [
+        request.user.pk,
+        request.GET.urlencode(),
+        last_modified.isoformat() if last_modified else '',
+        posts_changed,
+        facts.is_author,
+        sorted(facts.subscribed_categories),
+    ]
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """
+    То же, что делает django.views.decorators.http.condition до вызова представления,
+    для асинхронных представлений: ответ 304 (412) либо None
+    """
+    return get_conditional_response(
+        request,
+        etag=quote_etag(etag) if etag else None,
+        last_modified=timegm(last_modified.utctimetuple()) if last_modified else None,
+    )
+
+
+def add_validators(request, response, etag=None, last_modified=None):
+    if request.method in ('GET', 'HEAD'):
+        if last_modified and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+        if etag:
+            response.headers.setdefault('ETag', quote_etag(etag))
+    return response
+
+
+class ConditionalListMixin:
+    """
+    Подмешивается к спискам статей: ответ 304, если не изменилось ничего из входящего в list_etag
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        return condition(etag_func=self.list_etag)(super().dispatch)(request, *args, **kwargs)
+
+    def list_etag(self, request, *args, **kwargs):
+        last_modified = self.get_queryset().order_by().aggregate(last=Max('modified'))['last']
+        return list_etag(request, last_modified, posts_changed_at(), get_profile_facts(request.user))
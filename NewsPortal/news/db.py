@@ -0,0 +1,54 @@
+"""
+Настройка SQLite для одновременной работы нескольких потоков и процессов.
+При каждом подключении выполняются PRAGMA из SQLITE_PRAGMAS (WAL, synchronous=NORMAL,
+mmap_size, busy_timeout); записи, упавшие с «database is locked», повторяются с задержкой.
+"""
+import itertools
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection as default_connection
+from django.db import OperationalError
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        # Напрямую через драйвер, мимо обёрток выполнения и журнала запросов
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked_error(error):
+    message = str(error)
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def retry_on_locked(func):
+    """
+    Повторяет запись до SQLITE_WRITE_RETRIES раз с экспоненциальной задержкой от SQLITE_WRITE_RETRY_DELAY.
+    busy_timeout не спасает транзакцию, которая сначала читала, а потом пишет: если другой процесс
+    успел записать, SQLite сразу отвечает «database is locked», и транзакцию нужно начать заново.
+    Внутри внешней транзакции не повторяет: откатить её может только внешний код.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'SQLITE_WRITE_RETRIES', 5)
+        delay = getattr(settings, 'SQLITE_WRITE_RETRY_DELAY', 0.02)
+        for attempt in itertools.count(1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if attempt > retries or not is_locked_error(error) or default_connection.in_atomic_block:
+                    raise
+                logger.info('%s: database is locked, retry %d of %d', func.__qualname__, attempt, retries)
+            time.sleep(delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+    return wrapper
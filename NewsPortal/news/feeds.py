@@ -0,0 +1,166 @@
+"""
+Ленты RSS и Atom последних статей: общая и по категориям (/portal/feeds/...).
+Готовый документ кэшируется до изменения статей: ключ включает поколение лент, которое сигналы
+меняют при сохранении и удалении статей и изменении их категорий. Поколение хранится в общем кэше
+shared, чтобы его смену (в том числе командами загрузки) видели все процессы. ETag — то же поколение,
+поэтому опрос ленты с актуальной копией стоит одного чтения поколения.
+При промахе документ отдаётся потоком по записям и одновременно собирается для кэша.
+"""
+import io
+import time
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache, caches
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.xmlutils import SimplerXMLGenerator
+from django.views.decorators.http import condition
+
+from .censor import get_censor
+from .models import Category, Post
+
+GENERATION_KEY = 'feeds-generation'
+
+
+def generation():
+    return caches['shared'].get_or_set(GENERATION_KEY, time.time_ns, None)
+
+
+def invalidate():
+    """
+    Новое поколение: все закэшированные ленты и их ETag устаревают
+    """
+    caches['shared'].set(GENERATION_KEY, time.time_ns(), None)
+
+
+class StreamingFeedMixin:
+    """
+    Документ ленты частями: начало с описанием ленты, каждая запись отдельно, конец
+    """
+
+    def stream(self, encoding):
+        buffer = io.StringIO()
+        handler = SimplerXMLGenerator(buffer, encoding, short_empty_elements=True)
+
+        def flush():
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return chunk
+
+        handler.startDocument()
+        self.start_document(handler)
+        self.add_root_elements(handler)
+        yield flush()
+        for item in self.items:
+            handler.startElement(self.item_element, self.item_attributes(item))
+            self.add_item_elements(handler, item)
+            handler.endElement(self.item_element)
+            yield flush()
+        self.end_document(handler)
+        yield flush()
+
+
+class StreamingRssFeed(StreamingFeedMixin, Rss201rev2Feed):
+    item_element = 'item'
+
+    def start_document(self, handler):
+        handler.startElement('rss', self.rss_attributes())
+        handler.startElement('channel', self.root_attributes())
+
+    def end_document(self, handler):
+        self.endChannelElement(handler)
+        handler.endElement('rss')
+
+
+class StreamingAtomFeed(StreamingFeedMixin, Atom1Feed):
+    item_element = 'entry'
+
+    def start_document(self, handler):
+        handler.startElement('feed', self.root_attributes())
+
+    def end_document(self, handler):
+        handler.endElement('feed')
+
+
+def cached_stream(key, chunks):
+    """
+    Отдаёт части документа и после последней сохраняет весь документ в кэш
+    """
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.set(key, ''.join(parts), getattr(settings, 'FEED_CACHE_TIMEOUT', 24 * 60 * 60))
+
+
+class PostsFeed(Feed):
+    """
+    Последние FEED_ITEMS статей, всех или категории category_id
+    """
+    feed_type = StreamingRssFeed
+    description = 'Последние новости и статьи'
+
+    def __call__(self, request, category_id=None):
+        return condition(etag_func=self.etag)(self.respond)(request, category_id)
+
+    def etag(self, request, category_id=None):
+        """
+        Поколение читается из общего кэша один раз на запрос: ETag нужен и условию, и ключу документа
+        """
+        if not hasattr(request, '_feed_etag'):
+            request._feed_etag = f'{self.feed_type.__name__}-{category_id or "all"}-{generation()}'
+        return request._feed_etag
+
+    def respond(self, request, category_id=None):
+        content_type = self.feed_type.content_type
+        key = f'feed:{self.etag(request, category_id)}'
+        document = cache.get(key)
+        if document is not None:
+            return StreamingHttpResponse([document], content_type=content_type)
+        feed = self.get_feed(self.get_object(request, category_id), request)
+        return StreamingHttpResponse(cached_stream(key, feed.stream('utf-8')), content_type=content_type)
+
+    def get_object(self, request, category_id=None):
+        return get_object_or_404(Category, pk=category_id) if category_id is not None else None
+
+    def title(self, category):
+        return f'NewsPortal: {category}' if category else 'NewsPortal'
+
+    def link(self, category):
+        if category:
+            return f'{reverse("post_list")}search/?category={category.pk}'
+        return reverse('post_list')
+
+    def items(self, category):
+        posts = Post.objects.for_list().prefetch_related('category').order_by('-created', '-id')
+        if category:
+            posts = posts.filter(postcategory__category=category)
+        return posts[:getattr(settings, 'FEED_ITEMS', 20)]
+
+    # Текст проходит ту же цензуру, что и на страницах портала
+    def item_title(self, post):
+        return get_censor()(post.title)
+
+    def item_description(self, post):
+        return get_censor()(post.preview)
+
+    def item_pubdate(self, post):
+        return post.created
+
+    def item_updateddate(self, post):
+        return post.modified
+
+    def item_author_name(self, post):
+        return post.author.user.username
+
+    def item_categories(self, post):
+        return [category.name for category in post.category.all()]
+
+
+class PostsAtomFeed(PostsFeed):
+    feed_type = StreamingAtomFeed
+    subtitle = PostsFeed.description
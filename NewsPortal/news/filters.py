@@ -1,9 +1,15 @@
-from django_filters import FilterSet, DateFilter, ModelMultipleChoiceFilter
+from django_filters import FilterSet, DateFilter, ModelMultipleChoiceFilter, CharFilter
 from .models import Post, Category
+from .search import get_search_backend
 from django import forms
 
 
 class PostFilter(FilterSet):
+    q = CharFilter(
+        method='filter_q',
+        label='Search',  # поиск по заголовку и тексту, результаты по релевантности
+    )
+
     created = DateFilter(
         lookup_expr='gt',
         widget=forms.DateInput(attrs={'type': 'date'})
@@ -22,3 +28,6 @@ class PostFilter(FilterSet):
             'title': ['icontains'],
             'author__user__username': ['icontains'],
         }
+
+    def filter_q(self, queryset, name, value):
+        return get_search_backend().search(queryset, value)
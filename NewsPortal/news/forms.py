@@ -1,5 +1,6 @@
 from django import forms
 from .models import Post
+from .ratelimit import check_post_limit
 
 
 class PostCreateForm(forms.ModelForm):
@@ -11,3 +12,13 @@ class PostCreateForm(forms.ModelForm):
             'title',
             'content',
         ]
+
+    def clean(self):
+        """
+        Ошибка о превышении числа публикаций показывается в форме
+        """
+        cleaned_data = super().clean()
+        author = cleaned_data.get('author')
+        if author and self.instance._state.adding:
+            check_post_limit(author.pk)
+        return cleaned_data
@@ -0,0 +1,59 @@
+"""
+Кэш отрисованных фрагментов статьи (строка в списках, тело на странице статьи).
+Ключ включает id и редакцию статьи: изменение статьи или её категорий увеличивает редакцию,
+и старые фрагменты больше не читаются. Счётчики попаданий и промахов ведутся в памяти процесса.
+"""
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Имена фрагментов, используемых в шаблонах
+FRAGMENTS = ('post_row', 'post_body')
+
+
+class FragmentCacheStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, name, hit):
+        with self._lock:
+            self._counters[name]['hits' if hit else 'misses'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(counters) for name, counters in self._counters.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+stats = FragmentCacheStats()
+
+
+def fragment_key(name, post_id, revision):
+    return f'fragment:{name}:{post_id}:{revision}'
+
+
+def get_or_render(name, post, render):
+    """
+    Фрагмент name статьи post из кэша, либо результат render(), который сохраняется в кэш
+    """
+    key = fragment_key(name, post.pk, post.revision)
+    content = cache.get(key)
+    stats.record(name, content is not None)
+    if content is None:
+        content = render()
+        cache.set(key, content, getattr(settings, 'POST_FRAGMENT_CACHE_TIMEOUT', 24 * 60 * 60))
+    return content
+
+
+def invalidate(post):
+    """
+    Удаляет фрагменты текущей редакции статьи
+    """
+    cache.delete_many([fragment_key(name, post.pk, post.revision) for name in FRAGMENTS])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from news import timeline
+
+
+class Command(BaseCommand):
+    help = "Rebuilds per-category timelines from post categories, keeping TIMELINE_RETENTION newest posts each."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            entries = timeline.backfill()
+        self.stdout.write(self.style.SUCCESS(f'Added {entries} timeline entries'))
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news.benchmarks import SCENARIOS, compare_results
+
+
+class Command(BaseCommand):
+    help = "Runs performance benchmark scenarios and prints their results."
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Scenarios to run (default: all)')
+        parser.add_argument('--size', type=int, help='Scenario size (subscribers, rows, requests...)')
+        parser.add_argument('--clients', type=int, default=100, help='Concurrent HTTP clients (slow_clients)')
+        parser.add_argument('--client-delay', type=float, default=0.05,
+                            help='Seconds a slow client takes to read a response (slow_clients)')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='WSGI worker threads (slow_clients), concurrent workers (sqlite_concurrency)')
+        parser.add_argument('--duration', type=float, default=5,
+                            help='Seconds of load for each setup (sqlite_concurrency)')
+        parser.add_argument('--write-share', type=float, default=0.2,
+                            help='Share of writes among operations (sqlite_concurrency)')
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            help='Numbers of posts to seed, e.g. 1000 100000 1000000 (portal)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each measured path (portal)')
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--compare', help='Fail if results regressed against this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative slowdown when comparing (default: 0.2)')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}. '
+                               f'Available: {", ".join(SCENARIOS)}')
+
+        results = {}
+        for name in names:
+            self.stdout.write(f'{name}...')
+            results[name] = SCENARIOS[name](**options)
+            self.stdout.write(json.dumps(results[name], indent=2, default=str))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, default=str)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                regressions = compare_results(json.load(f), results, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions'))
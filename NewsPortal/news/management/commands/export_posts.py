@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from news.transfer import FORMATS, export_posts, guess_format
+
+
+class Command(BaseCommand):
+    help = "Streams all posts to a JSONL or CSV file (or stdout)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file, "-" for stdout (default)')
+        parser.add_argument('--format', choices=FORMATS, help='Default: by file extension, else jsonl')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Posts read from the database at once')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or guess_format(path)
+        # Данные могут идти в stdout, поэтому ход выгрузки пишется в stderr
+        progress = lambda count, seconds: self.stderr.write(
+            f'{count} posts, {count / seconds if seconds else 0:.0f} posts/s', self.style.NOTICE)
+
+        if path == '-':
+            count = export_posts(sys.stdout, format, options['chunk_size'], progress=progress)
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as stream:
+                count = export_posts(stream, format, options['chunk_size'], progress=progress)
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} posts'))
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from news.transfer import FORMATS, import_posts, guess_format
+
+
+class Command(BaseCommand):
+    help = ("Imports posts from a JSONL or CSV file (or stdin) in batches. Authors must exist, "
+            "missing categories are created.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Input file, "-" for stdin (default)')
+        parser.add_argument('--format', choices=FORMATS, help='Default: by file extension, else jsonl')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Posts written in one transaction')
+        parser.add_argument('--signals', action='store_true',
+                            help='Save posts one by one with model signals (subscriber notifications)')
+        parser.add_argument('--rate-limit', action='store_true',
+                            help='Enforce the per-author post limit (only with --signals)')
+
+    def handle(self, *args, **options):
+        if options['rate_limit'] and not options['signals']:
+            raise CommandError('--rate-limit requires --signals: batches are saved without the post limit check')
+        path = options['path']
+        format = options['format'] or guess_format(path)
+        progress = lambda count, seconds: self.stdout.write(
+            f'{count} posts, {count / seconds if seconds else 0:.0f} posts/s')
+        params = dict(batch_size=options['batch_size'], send_signals=options['signals'],
+                      rate_limit=options['rate_limit'], progress=progress)
+
+        try:
+            if path == '-':
+                count = import_posts(sys.stdin, format, **params)
+            else:
+                with open(path, encoding='utf-8', newline='') as stream:
+                    count = import_posts(stream, format, **params)
+        except (ValueError, ValidationError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Imported {count} posts'))
@@ -0,0 +1,55 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from news.notifications import claim_jobs, process_job, release_stale_jobs
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Drains the post notification outbox: sends queued notifications with retries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent sending threads')
+        parser.add_argument('--batch-size', type=int, default=50, help='Jobs claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Seconds between polls of an empty outbox')
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--retry-delay', type=float, default=30, help='Delay before the first retry, seconds')
+        parser.add_argument('--stale-after', type=int, default=15 * 60,
+                            help='Seconds after which a job left in processing is queued again')
+        parser.add_argument('--once', action='store_true', help='Drain due jobs and exit')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            while True:
+                release_stale_jobs(options['stale_after'])
+                jobs = claim_jobs(options['batch_size'])
+                if jobs:
+                    self.process(executor, jobs, options)
+                elif options['once']:
+                    break
+                else:
+                    close_old_connections()
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            logger.info('Stopping notification worker...')
+        finally:
+            if executor:
+                executor.shutdown()
+
+    def process(self, executor, jobs, options):
+        def run(job):
+            try:
+                return process_job(job, options['max_attempts'], options['retry_delay'])
+            finally:
+                if executor:
+                    close_old_connections()
+
+        results = list(executor.map(run, jobs)) if executor else [run(job) for job in jobs]
+        self.stdout.write(f'Sent {sum(results)} of {len(results)} notifications')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from news.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of posts."
+
+    def handle(self, *args, **options):
+        indexed = get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from news.models import Author
+
+
+class Command(BaseCommand):
+    help = "Recomputes ratings of all authors with one set-based UPDATE."
+
+    def handle(self, *args, **options):
+        updated = Author.objects.recompute_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed ratings of {updated} authors'))
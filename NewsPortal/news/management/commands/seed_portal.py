@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news.seed import seed_portal
+
+
+class Command(BaseCommand):
+    help = "Generates synthetic users, authors, categories, posts, comments and subscriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000, help='Number of posts')
+        parser.add_argument('--users', type=int, help='Number of users (default: posts / 10)')
+        parser.add_argument('--authors', type=int, help='Number of authors (default: users / 10)')
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--comments-per-post', type=int, default=2, help='Average comments per post')
+        parser.add_argument('--days', type=int, default=365, help='Posts are spread over this many past days')
+        parser.add_argument('--seed', type=int, default=0, help='Random generator seed')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            counts = seed_portal(
+                options['posts'],
+                users=options['users'],
+                authors=options['authors'],
+                categories=options['categories'],
+                comments_per_post=options['comments_per_post'],
+                days=options['days'],
+                seed=options['seed'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded ' + ', '.join(f'{count} {name}' for name, count in counts.items())))
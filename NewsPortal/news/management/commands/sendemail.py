@@ -1,9 +1,14 @@
 # runapscheduler.py
 import logging
 
-from datetime import datetime
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import timedelta
 
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef, Value
+from django.db.models.functions import Coalesce
 
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
@@ -11,11 +16,12 @@ from django.core.management.base import BaseCommand
 from django_apscheduler.jobstores import DjangoJobStore
 from django_apscheduler.models import DjangoJobExecution
 from django_apscheduler import util
-from news.models import Category, Post
+from news.models import Post, PostCategory, SubscribersOfNews, TimelineEntry
 from django.utils import timezone
+from django.utils.safestring import mark_safe
 
 from django.template.loader import render_to_string
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 
 logger = logging.getLogger(__name__)
 
@@ -25,37 +31,80 @@ def send_email_to_subscribers():
     Если пользователь подписан на какую-либо категорию, то каждую неделю ему приходит
     на почту список новых статей, появившийся за неделю с гиперссылкой на них,
     чтобы пользователь мог перейти и прочесть любую из статей.
+
+    Для каждой подписки хранится время последней сводки, выбираются только статьи новее него.
+    Каждый пользователь получает одно письмо по всем своим категориям, пользователи без
+    новых статей пропускаются. Читаются только подписки с новыми статьями, эти статьи и адреса
+    их подписчиков.
     """
-    for category in Category.objects.all():
-        today = datetime.now()
-        start = datetime(today.year, today.month, today.day - 7, tzinfo=timezone.utc)
-        finish = datetime(today.year, today.month, today.day, 23, 59, 59, 999999, tzinfo=timezone.utc)
-        posted_last_weeks = Post.objects.filter(created__range=[start, finish]).filter(category=category)
-
-        if posted_last_weeks:
-
-            subject = f'News of last week of {category}'
-
-            domain = settings.CURRENT_HOST
-
-            for current_user in category.subscribers.all():
-                print(f'send email of cat {category} to user {current_user}')
-
-                html_content = render_to_string(
-                    'news_last_week_to_subscr.html',
-                    {
-                        'posted': posted_last_weeks,
-                        'domain': domain,
-                    }
-                )
-                msg = EmailMultiAlternatives(
-                    subject=subject,
-                    body='',
-                    from_email='',
-                    to=[current_user.email],
-                )
-                msg.attach_alternative(html_content, "text/html")
-                msg.send()
+    now = timezone.now()
+    default_since = now - timedelta(days=7)
+
+    # Только подписки, в категории которых есть статьи новее их собственной отметки: подписки
+    # на категории без новых статей не расширяют выборку статей. Проверка — поиск по индексу
+    # (категория, created) ленты категории, а не перебор всех статей категории
+    watermark = Coalesce(OuterRef('last_digest_at'), Value(default_since))
+    new_in_category = TimelineEntry.objects.filter(
+        category_id=OuterRef('category_id'), created__gt=watermark, created__lte=now)
+    subscriptions = list(SubscribersOfNews.objects.filter(Exists(new_in_category))
+                         .values_list('pk', 'user_id', 'category_id', 'last_digest_at'))
+    if not subscriptions:
+        return 0
+    oldest = min(last_digest_at or default_since for _, _, _, last_digest_at in subscriptions)
+
+    # Новые статьи категорий этих подписок по возрастанию даты, одним запросом диапазоном по created
+    created_in, posts_in = defaultdict(list), defaultdict(list)
+    links = PostCategory.objects.filter(
+        category_id__in={category_id for _, _, category_id, _ in subscriptions},
+        post__in=Post.objects.filter(created__gt=oldest, created__lte=now),
+    ).order_by('post__created', 'post_id').values_list('category_id', 'post__created', 'post_id')
+    for category_id, created, post_id in links:
+        created_in[category_id].append(created)
+        posts_in[category_id].append(post_id)
+
+    posts_of_user = defaultdict(set)
+    for _, user_id, category_id, last_digest_at in subscriptions:
+        start = bisect_right(created_in[category_id], last_digest_at or default_since)
+        posts_of_user[user_id].update(posts_in[category_id][start:])
+
+    all_post_ids = set().union(*posts_of_user.values())
+    posts = list(Post.objects.filter(pk__in=all_post_ids).only('id', 'title', 'created').order_by('created', 'id'))
+    position = {post.pk: i for i, post in enumerate(posts)}
+    emails = dict(User.objects.filter(pk__in=posts_of_user).exclude(email='').values_list('pk', 'email'))
+
+    domain = settings.CURRENT_HOST
+    # Статья входит в сводки многих пользователей, поэтому её строка отрисовывается один раз
+    lines = [render_to_string('news_last_week_post.html', {'post': post, 'domain': domain}) for post in posts]
+    messages = []
+    for user_id, post_ids in posts_of_user.items():
+        if user_id not in emails:
+            continue
+        html_content = render_to_string(
+            'news_last_week_to_subscr.html',
+            {
+                'posted': mark_safe(''.join(lines[i] for i in sorted(position[pk] for pk in post_ids))),
+                'domain': domain,
+            }
+        )
+        msg = EmailMultiAlternatives(
+            subject='News of last week',
+            body='',
+            from_email='',
+            to=[emails[user_id]],
+        )
+        msg.attach_alternative(html_content, "text/html")
+        messages.append(msg)
+
+    batch_size = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+    with get_connection() as connection:
+        for i in range(0, len(messages), batch_size):
+            connection.send_messages(messages[i:i + batch_size])
+
+    sent_ids = [pk for pk, _, _, _ in subscriptions]
+    for i in range(0, len(sent_ids), batch_size):
+        SubscribersOfNews.objects.filter(pk__in=sent_ids[i:i + batch_size]).update(last_digest_at=now)
+    logger.info('Sent weekly digest to %s subscribers', len(messages))
+    return len(messages)
 
 
 # The `close_old_connections` decorator ensures that database connections, that have become
@@ -83,8 +132,7 @@ class Command(BaseCommand):
 
         scheduler.add_job(
             send_email_to_subscribers,
-            # trigger=CronTrigger(day_of_week="mon", hour="00", minute="00"),
-            trigger=CronTrigger(second="*/10"),
+            trigger=CronTrigger(day_of_week="mon", hour="00", minute="00"),
             id="send_email_to_subscribers",  # The `id` assigned to each job MUST be unique
             max_instances=1,
             replace_existing=True,
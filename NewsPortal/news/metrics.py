@@ -0,0 +1,207 @@
+"""
+Замеры запросов по представлениям: время ответа, число и время запросов к базе, время отрисовки шаблона.
+Копятся в гистограммах в памяти процесса и отдаются в текстовом формате Prometheus (/metrics).
+Запросы, превысившие REQUEST_QUERY_BUDGET или REQUEST_TIME_BUDGET, пишутся в журнал вместе с их SQL.
+"""
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = {
+    'news_request_duration_seconds': ('Время ответа', SECONDS_BUCKETS),
+    'news_request_db_queries': ('Число запросов к базе', QUERIES_BUCKETS),
+    'news_request_db_duration_seconds': ('Время запросов к базе', SECONDS_BUCKETS),
+    'news_template_render_seconds': ('Время отрисовки шаблона', SECONDS_BUCKETS),
+}
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """
+    Гистограммы METRICS в разрезе представлений
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(dict)
+
+    def observe(self, name, view, value):
+        with self._lock:
+            histogram = self._histograms[name].get(view)
+            if histogram is None:
+                histogram = self._histograms[name][view] = Histogram(METRICS[name][1])
+            histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, _) in METRICS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for view, histogram in sorted(self._histograms[name].items()):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum:g}')
+                    lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+class QueryRecorder:
+    """
+    Обёртка выполнения запросов (connection.execute_wrapper): запоминает SQL и время каждого запроса
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.render_seconds = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    def db_seconds(self):
+        return sum(seconds for _, seconds in self.queries)
+
+    def report(self, limit=20):
+        """
+        Одинаковые запросы (SQL без параметров) сгруппированы, самые долгие в сумме — первыми
+        """
+        groups = defaultdict(lambda: [0, 0])
+        for sql, seconds in self.queries:
+            groups[sql][0] += 1
+            groups[sql][1] += seconds
+        top = sorted(groups.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return '\n'.join(f'  {count} x {seconds * 1000:.1f} ms  {sql}' for sql, (count, seconds) in top)
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view = getattr(match.func, 'view_class', match.func)
+    if not hasattr(view, '__qualname__'):
+        # Экземпляр с __call__, например лента
+        view = type(view)
+    return f'{view.__module__}.{view.__qualname__}'
+
+
+class RequestMetricsMiddleware:
+    """
+    Ставится первым в MIDDLEWARE, чтобы время ответа включало остальные промежуточные слои
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Так же Django помечает асинхронные MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder = request._query_recorder = QueryRecorder()
+        started = time.perf_counter()
+        with self.recording(recorder):
+            response = self.get_response(request)
+        self.finish(request, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        recorder = request._query_recorder = QueryRecorder()
+        started = time.perf_counter()
+        # Соединения с базой у каждого потока свои: обёртки ставятся в потоке, где асинхронный
+        # ORM выполняет запросы этого запроса
+        stack = await sync_to_async(self.recording)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.finish(request, recorder, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def recording(recorder):
+        """
+        Ставит recorder на все соединения текущего потока; снимается закрытием возвращённого ExitStack
+        """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def process_template_response(self, request, response):
+        """
+        Вызывается перед отрисовкой TemplateResponse (generic-представления); время отрисовки
+        засекается до её окончания
+        """
+        recorder = getattr(request, '_query_recorder', None)
+        if recorder is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                recorder.render_seconds = time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def finish(request, recorder, seconds):
+        view = view_label(request)
+        db_seconds = recorder.db_seconds()
+        registry.observe('news_request_duration_seconds', view, seconds)
+        registry.observe('news_request_db_queries', view, len(recorder.queries))
+        registry.observe('news_request_db_duration_seconds', view, db_seconds)
+        if recorder.render_seconds is not None:
+            registry.observe('news_template_render_seconds', view, recorder.render_seconds)
+
+        query_budget = getattr(settings, 'REQUEST_QUERY_BUDGET', 30)
+        time_budget = getattr(settings, 'REQUEST_TIME_BUDGET', 0.5)
+        if len(recorder.queries) > query_budget or seconds > time_budget:
+            logger.warning(
+                'Request over budget: %s %s (%s) %.3f s, %d queries, %.3f s in DB\n%s',
+                request.method, request.path, view, seconds, len(recorder.queries), db_seconds, recorder.report(),
+            )
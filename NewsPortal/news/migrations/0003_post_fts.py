@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE news_post_fts USING fts5(title, content, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute('INSERT INTO news_post_fts (rowid, title, content) SELECT id, title, content FROM news_post')
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS news_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0002_subscribersofnews_category_subscribers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
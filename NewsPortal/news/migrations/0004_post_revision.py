@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0003_post_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
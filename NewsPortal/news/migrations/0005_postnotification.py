@@ -0,0 +1,34 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0004_post_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=400)),
+                ('status', models.CharField(choices=[('PND', 'Pending'), ('PRC', 'Processing'), ('SNT', 'Sent'), ('FLD', 'Failed')], default='PND', max_length=3)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=32)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='news.post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postnotification',
+            index=models.Index(fields=['status', 'available_at'], name='news_notification_due_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0005_postnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscribersofnews',
+            name='last_digest_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
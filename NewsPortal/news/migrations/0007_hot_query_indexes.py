@@ -0,0 +1,50 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Перед созданием уникальных ограничений удаляет повторы, оставляя самую раннюю запись
+    """
+    for model_name, fields in (('PostCategory', ('post', 'category')), ('SubscribersOfNews', ('category', 'user'))):
+        model = apps.get_model('news', model_name)
+        duplicates = model.objects.values(*fields).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+        for row in duplicates:
+            model.objects.filter(**{field: row[field] for field in fields}).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0006_subscribersofnews_last_digest_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='news_comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['created', 'id'], name='news_post_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'created'], name='news_post_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postcategory',
+            index=models.Index(fields=['category', 'post'], name='news_postcat_category_post_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='postcategory',
+            constraint=models.UniqueConstraint(fields=('post', 'category'), name='news_postcategory_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='subscribersofnews',
+            constraint=models.UniqueConstraint(fields=('category', 'user'), name='news_subscribersofnews_unique'),
+        ),
+    ]
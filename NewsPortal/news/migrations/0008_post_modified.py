@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def fill_modified(apps, schema_editor):
+    """
+    Для существующих статей временем изменения считается время создания
+    """
+    apps.get_model('news', 'Post').objects.update(modified=F('created'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_modified, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['modified'], name='news_post_modified_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.1 on 2026-10-18 09:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import news.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0008_post_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostSearchIndex',
+            fields=[
+                ('post', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='news.post')),
+                ('title', models.CharField(max_length=300)),
+                ('content', models.TextField()),
+                ('document', news.models.FullTextDocumentField(db_column='news_post_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'news_post_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.1.1 on 2026-10-18 09:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    # Как news.timeline.backfill: последние TIMELINE_RETENTION статей каждой категории
+    PostCategory = apps.get_model('news', 'PostCategory')
+    TimelineEntry = apps.get_model('news', 'TimelineEntry')
+    retention = getattr(settings, 'TIMELINE_RETENTION', 1000)
+    category_ids = PostCategory.objects.order_by().values_list('category_id', flat=True).distinct()
+    for category_id in list(category_ids):
+        links = (PostCategory.objects.filter(category_id=category_id)
+                 .order_by('-post__created', '-post_id')
+                 .values_list('post__created', 'post_id')[:retention])
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(category_id=category_id, created=created, post_id=post_id) for created, post_id in links
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0009_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField()),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='news.category')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='news.post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['category', 'created', 'post'], name='news_timeline_category_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('category', 'post'), name='news_timeline_category_post_uniq'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.1 on 2026-10-18 09:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_comments(apps, schema_editor):
+    Post = apps.get_model('news', 'Post')
+    Comment = apps.get_model('news', 'Comment')
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(count=Count('id'))
+    Post.objects.update(comment_count=Coalesce(Subquery(comments.values('count')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0010_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
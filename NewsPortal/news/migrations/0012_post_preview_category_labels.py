@@ -0,0 +1,54 @@
+# Generated by Django 4.1.1 on 2026-10-18 09:49
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+from django.db.models.functions import Concat, Length, Substr
+from django.db.models.lookups import GreaterThan
+
+PREVIEW_LENGTH = 124
+BATCH_SIZE = 1000
+
+
+def fill_previews_and_labels(apps, schema_editor):
+    Post = apps.get_model('news', 'Post')
+    PostCategory = apps.get_model('news', 'PostCategory')
+    # Как Post.preview_of, но одним запросом в базе
+    Post.objects.update(preview=Case(
+        When(GreaterThan(Length('content'), PREVIEW_LENGTH),
+             then=Concat(Substr('content', 1, PREVIEW_LENGTH), Value('...'))),
+        default='content',
+        output_field=models.TextField(),
+    ))
+    pks = list(Post.objects.order_by().values_list('pk', flat=True))
+    for start in range(0, len(pks), BATCH_SIZE):
+        batch = pks[start:start + BATCH_SIZE]
+        labels = defaultdict(list)
+        links = (PostCategory.objects.filter(post_id__in=batch).order_by('pk')
+                 .values_list('post_id', 'category__name'))
+        for post_id, name in links:
+            labels[post_id].append(name)
+        Post.objects.bulk_update([Post(pk=pk, category_labels=', '.join(labels[pk])) for pk in batch],
+                                 ['category_labels'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0011_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='category_labels',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='preview',
+            field=models.CharField(default='', editable=False, max_length=127),
+        ),
+        migrations.RunPython(fill_previews_and_labels, migrations.RunPython.noop),
+    ]
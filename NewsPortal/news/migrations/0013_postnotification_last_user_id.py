@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0012_post_preview_category_labels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postnotification',
+            name='last_user_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0014_create_cache_table'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
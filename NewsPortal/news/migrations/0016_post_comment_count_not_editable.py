@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0015_post_revision_not_editable'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,8 +1,25 @@
-from django.db import models
+from collections import defaultdict
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.db.models import Sum, F, OuterRef, Subquery, Case, When, Value, Lookup, Count
+from django.db.models.functions import Coalesce, Greatest
 from django.urls import reverse
-from . import resources
+from django.utils import timezone
+from . import resources, votes
+from .db import retry_on_locked
+
+
+def increment_case(deltas, field='rating'):
+    """
+    Выражение для UPDATE, увеличивающее поле field каждой записи на своё приращение.
+    deltas: {pk: приращение}
+    """
+    if len(deltas) == 1:
+        return F(field) + next(iter(deltas.values()))
+    return Case(
+        *[When(pk=pk, then=F(field) + delta) for pk, delta in deltas.items()],
+        default=F(field),
+    )
 
 
 class Likeable(models.Model):
@@ -17,12 +34,71 @@ class Likeable(models.Model):
     rating = models.IntegerField(default=0)
 
     def like(self):
-        self.rating += 1
-        self.save()
+        self.vote(1)
 
     def dislike(self):
-        self.rating -= 1
-        self.save()
+        self.vote(-1)
+
+    def vote(self, delta):
+        """
+        Изменяет рейтинг на delta атомарным UPDATE только поля rating.
+        Если включён буфер голосов, голос копится в памяти и записывается в базу пачкой.
+        """
+        if votes.vote_buffer.enabled:
+            votes.vote_buffer.add(type(self), self.pk, delta)
+            self.rating += delta
+        else:
+            type(self).apply_rating_deltas({self.pk: delta})
+            self.refresh_from_db(fields=['rating'])
+
+    @classmethod
+    @retry_on_locked
+    def apply_rating_deltas(cls, deltas):
+        """
+        Добавляет приращения {pk: приращение} к рейтингу объектов и их авторов в одной транзакции
+        """
+        with transaction.atomic():
+            cls.objects.filter(pk__in=deltas).update(rating=increment_case(deltas), **cls.rating_touch_fields())
+            Author.apply_rating_deltas(cls.author_rating_deltas(deltas))
+
+    @classmethod
+    def rating_touch_fields(cls):
+        """
+        Поля, которые обновляются вместе с рейтингом. Переопределяется наследниками.
+        """
+        return {}
+
+    @classmethod
+    def author_rating_deltas(cls, deltas):
+        """
+        Пересчитывает изменения рейтинга объектов {pk: приращение} в изменения рейтинга авторов
+        {pk автора: приращение}. Переопределяется наследниками.
+        """
+        return {}
+
+
+class AuthorQuerySet(models.QuerySet):
+
+    def recompute_ratings(self):
+        """
+        Пересчитывает рейтинг всех авторов выборки одним UPDATE с подзапросами
+        """
+        return self.update(rating=self.rating_expression())
+
+    @staticmethod
+    def rating_expression():
+        """
+        Рейтинг автора как SQL-выражение (см. Author.update_rating)
+        """
+        posts_rating = Post.objects.filter(author=OuterRef('pk')).order_by().values(
+            'author').annotate(total=Sum('rating')).values('total')
+        comments_rating = Comment.objects.filter(user=OuterRef('user')).order_by().values(
+            'user').annotate(total=Sum('rating')).values('total')
+        post_comments_rating = Comment.objects.filter(post__author=OuterRef('pk')).order_by().values(
+            'post__author').annotate(total=Sum('rating')).values('total')
+        return (Coalesce(Subquery(posts_rating), Value(0)) * resources.post_rating_weight
+                + Coalesce(Subquery(comments_rating), Value(0))
+                + Coalesce(Subquery(post_comments_rating), Value(0)))
 
 
 class Author(models.Model):
@@ -35,26 +111,27 @@ class Author(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     rating = models.IntegerField(default=0)
 
+    objects = AuthorQuerySet.as_manager()
+
     def update_rating(self):
         """
         Обновляет рейтинг пользователя, переданный в аргумент этого метода:
             суммарный рейтинг каждой статьи автора умножается на 3;
             суммарный рейтинг всех комментариев автора;
             суммарный рейтинг всех комментариев к статьям автора.
+        Рейтинг считается в базе одним запросом.
         """
-        posts = Post.objects.filter(author=self)
-        posts_rating = 0
-        all_comments_rating = 0
-        for post in posts:
-            posts_rating += post.rating * 3
-            all_post_comment = Comment.objects.filter(post=post)
-            for comment in all_post_comment:
-                all_comments_rating += comment.rating
+        Author.objects.filter(pk=self.pk).recompute_ratings()
+        self.refresh_from_db(fields=['rating'])
 
-        comments_rating = Comment.objects.filter(user=self.user).aggregate(Sum('rating'))
-
-        self.rating = posts_rating + all_comments_rating + comments_rating
-        self.save()
+    @staticmethod
+    def apply_rating_deltas(deltas):
+        """
+        Атомарно добавляет приращения {pk автора: приращение} к рейтингу авторов
+        """
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if deltas:
+            Author.objects.filter(pk__in=deltas).update(rating=increment_case(deltas))
 
 
 class Category(models.Model):
@@ -69,6 +146,50 @@ class Category(models.Model):
         return self.name
 
 
+def comment_count_subquery():
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(count=Count('id'))
+    return Coalesce(Subquery(comments.values('count')), 0)
+
+
+class PostQuerySet(models.QuerySet):
+
+    def for_list(self):
+        """
+        Выборка для страниц списка статей: автор и пользователь загружаются одним запросом,
+        полный текст не читается — в списке выводятся сохранённые preview и category_labels.
+        """
+        return self.select_related('author__user').defer('content')
+
+    def refresh_category_labels(self, batch_size=1000):
+        """
+        Пересчитывает category_labels статей выборки по их категориям (после изменения связей
+        или загрузки bulk_create)
+        """
+        pks = list(self.order_by().values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            labels = defaultdict(list)
+            links = (PostCategory.objects.filter(post_id__in=batch).order_by('pk')
+                     .values_list('post_id', 'category__name'))
+            for post_id, name in links:
+                labels[post_id].append(name)
+            Post.objects.bulk_update(
+                [Post(pk=pk, category_labels=Post.labels_of(labels[pk])) for pk in batch], ['category_labels'])
+        return len(pks)
+
+    def recount_comments(self):
+        """
+        Пересчитывает comment_count статей выборки по комментариям (после загрузки bulk_create)
+        """
+        return self.update(comment_count=comment_count_subquery())
+
+    def bump_revision(self):
+        """
+        Увеличивает редакцию статей выборки, например, при изменении их категорий
+        """
+        return self.update(revision=F('revision') + 1, modified=timezone.now())
+
+
 class Post(Likeable):
     """
     Эта модель должна содержать в себе статьи и новости, которые создают пользователи.
@@ -88,24 +209,138 @@ class Post(Likeable):
     category = models.ManyToManyField(Category, through='PostCategory')
     title = models.CharField(max_length=300)
     content = models.TextField(default="")
+    # Номер редакции, увеличивается при каждом сохранении. Входит в ключи кэша отрисовки статьи
+    revision = models.PositiveIntegerField(default=0, editable=False)
+    # Время последнего изменения статьи, её категорий, рейтинга или комментариев (для условных GET-запросов)
+    modified = models.DateTimeField(auto_now=True)
+    # Число комментариев, ведётся сигналами создания и удаления комментариев
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    preview_length = 124
+    # Начало текста для списков, пересчитывается при сохранении: спискам не нужен полный текст
+    preview = models.CharField(max_length=preview_length + 3, default='', editable=False)
+    # Названия категорий через запятую, пересчитываются сигналами изменения категорий
+    category_labels = models.TextField(default='', editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Сортировка и постраничный вывод списков по (created, id)
+            models.Index(fields=['created', 'id'], name='news_post_created_id_idx'),
+            # Ограничение числа публикаций автора
+            models.Index(fields=['author', 'created'], name='news_post_author_created_idx'),
+            # Последнее изменение среди статей для ETag списков
+            models.Index(fields=['modified'], name='news_post_modified_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.title}: {self.author} (price:{self.preview()})'
+        return f'{self.title}: {self.author} (price:{self.preview})'
 
-    def preview(self):
+    @classmethod
+    def preview_of(cls, content):
         """
         Возвращает первые 124 символа статьи дополняя многоточием
         """
-        max_len = 124
-        suffix = '...' if len(self.content) > max_len else ''
-        return f'{self.content[:max_len]}{suffix}'
+        max_len = cls.preview_length
+        suffix = '...' if len(content) > max_len else ''
+        return f'{content[:max_len]}{suffix}'
+
+    @staticmethod
+    def labels_of(names):
+        return ', '.join(names)
 
     def get_absolute_url(self):
         return reverse('post_detail', args=[str(self.id)])
 
+    @classmethod
+    def rating_touch_fields(cls):
+        return {'modified': timezone.now()}
+
+    @classmethod
+    def add_comments(cls, post_id, delta):
+        """
+        Атомарно изменяет число комментариев статьи; страница статьи при этом меняется
+        """
+        cls.objects.filter(pk=post_id).update(
+            comment_count=Greatest(F('comment_count') + delta, 0), modified=timezone.now())
+
+    @classmethod
+    def author_rating_deltas(cls, deltas):
+        """
+        Рейтинг статьи входит в рейтинг её автора с весом 3
+        """
+        result = defaultdict(int)
+        for pk, author_id in Post.objects.filter(pk__in=deltas).values_list('pk', 'author_id'):
+            result[author_id] += deltas[pk] * resources.post_rating_weight
+        return result
+
+    def comments_author_rating_deltas(self, sign=1):
+        """
+        Изменения рейтинга авторов {pk автора: приращение} от рейтинга всех комментариев статьи
+        (sign=-1 — при их удалении): суммы по комментаторам одним запросом
+        """
+        users_deltas = dict(Comment.objects.filter(post_id=self.pk).exclude(rating=0).order_by()
+                            .values('user_id').annotate(total=Sum('rating')).values_list('user_id', 'total'))
+        result = defaultdict(int)
+        if users_deltas:
+            result[self.author_id] += sign * sum(users_deltas.values())
+            for author_id, user_id in Author.objects.filter(user_id__in=users_deltas).values_list('pk', 'user_id'):
+                result[author_id] += sign * users_deltas[user_id]
+        return result
+
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         # ToDo сделать контроль не более 3 записей от автора в день, вместо pre_save
+        bump = not self._state.adding
+        if 'content' not in self.get_deferred_fields() and (update_fields is None or 'content' in update_fields):
+            self.preview = self.preview_of(self.content)
+            if update_fields is not None:
+                update_fields = {*update_fields, 'preview'}
+        if bump:
+            # Увеличивается в базе: редакцию могли поднять, пока объект был в памяти
+            self.revision = F('revision') + 1
+            if update_fields is not None:
+                update_fields = {*update_fields, 'revision'}
         super().save(force_insert, force_update, using, update_fields)
+        if bump:
+            self.refresh_from_db(fields=['revision'])
+
+
+class FullTextMatch(Lookup):
+    """
+    Условие SQLite FTS5: <таблица> MATCH <выражение>
+    """
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class FullTextDocumentField(models.TextField):
+    pass
+
+
+FullTextDocumentField.register_lookup(FullTextMatch)
+
+
+class PostSearchIndex(models.Model):
+    """
+    Таблица FTS5 поискового индекса статей (создаётся миграцией 0003, только для SQLite).
+    Нужна, чтобы присоединять индекс к выборке статей: ранг (bm25) вычисляется один раз
+    на найденную статью, а не коррелированным подзапросом.
+    """
+    post = models.OneToOneField(Post, on_delete=models.DO_NOTHING, primary_key=True,
+                                db_column='rowid', related_name='search_index')
+    title = models.CharField(max_length=300)
+    content = models.TextField()
+    # Скрытые столбцы FTS5: столбец с именем таблицы (для MATCH) и ранг найденной строки
+    document = FullTextDocumentField(db_column='news_post_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'news_post_fts'
 
 
 class PostCategory(models.Model):
@@ -117,6 +352,36 @@ class PostCategory(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'category'], name='news_postcategory_unique'),
+        ]
+        indexes = [
+            # Отбор статей по категории
+            models.Index(fields=['category', 'post'], name='news_postcat_category_post_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """
+    Лента категории: (категория, время создания статьи, статья). Заполняется при добавлении статьи
+    в категорию, хранит не больше TIMELINE_RETENTION последних статей категории (news.timeline).
+    Лента подписок пользователя сливает ленты его категорий, не соединяя статьи с подписками.
+    """
+    # Отдельный индекс по категории не нужен: она первая в индексе ленты
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+', db_index=False)
+    created = models.DateTimeField()
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'post'], name='news_timeline_category_post_uniq'),
+        ]
+        indexes = [
+            # Лента категории от новых к старым читается диапазоном индекса
+            models.Index(fields=['category', 'created', 'post'], name='news_timeline_category_idx'),
+        ]
+
 
 class Comment(Likeable):
     """
@@ -134,6 +399,26 @@ class Comment(Likeable):
     content = models.TextField(default="")
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created'], name='news_comment_post_created_idx'),
+        ]
+
+    @classmethod
+    def author_rating_deltas(cls, deltas):
+        """
+        Рейтинг комментария входит в рейтинг автора статьи и в рейтинг автора-комментатора
+        """
+        result = defaultdict(int)
+        users_deltas = defaultdict(int)
+        rows = Comment.objects.filter(pk__in=deltas).values_list('pk', 'user_id', 'post__author_id')
+        for pk, user_id, post_author_id in rows:
+            result[post_author_id] += deltas[pk]
+            users_deltas[user_id] += deltas[pk]
+        for author_id, user_id in Author.objects.filter(user_id__in=users_deltas).values_list('pk', 'user_id'):
+            result[author_id] += users_deltas[user_id]
+        return result
+
 
 class SubscribersOfNews(models.Model):
     """
@@ -141,3 +426,36 @@ class SubscribersOfNews(models.Model):
     """
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # До этого момента статьи категории уже разосланы подписчику в еженедельной сводке
+    last_digest_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'user'], name='news_subscribersofnews_unique'),
+        ]
+
+
+class PostNotification(models.Model):
+    """
+    Очередь (outbox) уведомлений подписчиков об опубликованной или изменённой статье.
+    Задача записывается в той же транзакции, что и статья, а рассылает её отдельный процесс
+    (команда process_notifications), с повторами при ошибках.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    subject = models.CharField(max_length=400)
+    status = models.CharField(max_length=3, choices=resources.NOTIFICATION_STATUS,
+                              default=resources.notification_pending)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Не раньше этого времени задача может быть взята в работу (для отложенных повторов)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=32, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    # pk последнего подписчика, которому письмо уже отправлено: повтор продолжает с него
+    last_user_id = models.PositiveIntegerField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='news_notification_due_idx'),
+        ]
@@ -0,0 +1,189 @@
+"""
+Рассылка уведомлений подписчикам о новых статьях через очередь PostNotification.
+"""
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import resources
+from .models import Post, PostNotification
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(post: Post, subject: str):
+    """
+    Ставит уведомление о статье в очередь. Вызывается в транзакции сохранения статьи:
+    если транзакция откатится, задачи не будет.
+    """
+    return PostNotification.objects.create(post=post, subject=subject)
+
+
+class JobLost(Exception):
+    """
+    Задачу, пока она рассылалась, вернули в очередь и забрал другой обработчик
+    """
+
+
+def post_subscribers(post: Post):
+    """
+    Подписчики категорий статьи по возрастанию pk. Подписанный на несколько категорий статьи получает одно письмо.
+    """
+    return User.objects.filter(category__post=post).exclude(email='').distinct().order_by('pk')
+
+
+def send_mail_to_subscriber(post: Post, subject: str, after_user_id=None, on_batch_sent=None):
+    """
+    При создании новости подписчикам этой категории автоматически отправляется сообщение о пополнении в разделе.
+    Рассылка продолжается с подписчика после after_user_id; после каждой отправленной пачки
+    вызывается on_batch_sent(pk последнего получателя пачки).
+    """
+    subscribers = post_subscribers(post)
+    if after_user_id is not None:
+        subscribers = subscribers.filter(pk__gt=after_user_id)
+    last_user_id = None
+
+    def recipients():
+        nonlocal last_user_id
+        for pk, username, email in subscribers.values_list('pk', 'username', 'email').iterator(chunk_size=1000):
+            # Пачка уходит сразу после её последнего получателя, до чтения следующего
+            last_user_id = pk
+            yield username, email
+
+    def batch_sent():
+        if on_batch_sent:
+            on_batch_sent(last_user_id)
+
+    return send_post_notification(post, subject, recipients(), on_batch_sent=batch_sent)
+
+
+def greeting(username):
+    return f'\nЗдравствуй, {username}. Новая статья в твоём любимом разделе!'
+
+
+def send_post_notification(post: Post, subject: str, recipients, connection=None, on_batch_sent=None):
+    """
+    Рассылает письмо о статье получателям recipients — парам (имя пользователя, email).
+    Шаблон отрисовывается один раз, к нему добавляется только приветствие получателя.
+    Письма уходят пачками по NOTIFICATION_BATCH_SIZE через одно SMTP-соединение,
+    после каждой пачки вызывается on_batch_sent().
+    Возвращает число отправленных писем.
+    """
+    html_content = render_to_string(
+        'news_create_email.html',
+        {
+            'post': post,
+            'domain': settings.CURRENT_HOST,
+        }
+    )
+    batch_size = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+    connection = connection or get_connection()
+    sent = 0
+    batch = []
+    with connection:
+        for username, email in recipients:
+            msg = EmailMultiAlternatives(
+                subject=subject,
+                body='',
+                from_email='',
+                to=[email],
+                connection=connection,
+            )
+            msg.attach_alternative(html_content + greeting(username), "text/html")
+            batch.append(msg)
+            if len(batch) >= batch_size:
+                sent += connection.send_messages(batch) or 0
+                batch = []
+                if on_batch_sent:
+                    on_batch_sent()
+        if batch:
+            sent += connection.send_messages(batch) or 0
+            if on_batch_sent:
+                on_batch_sent()
+    return sent
+
+
+def claim_jobs(limit):
+    """
+    Забирает в работу до limit задач, срок которых наступил.
+    Задача помечается меткой процесса условным UPDATE, поэтому несколько обработчиков не возьмут одну задачу.
+    """
+    token = uuid.uuid4().hex
+    due = PostNotification.objects.filter(
+        status=resources.notification_pending,
+        available_at__lte=timezone.now(),
+    ).order_by('available_at', 'id').values_list('pk', flat=True)[:limit]
+    PostNotification.objects.filter(pk__in=list(due), status=resources.notification_pending).update(
+        status=resources.notification_processing,
+        locked_by=token,
+        locked_at=timezone.now(),
+    )
+    return list(PostNotification.objects.filter(locked_by=token).select_related('post'))
+
+
+def release_stale_jobs(timeout):
+    """
+    Возвращает в очередь задачи, которые в работе дольше timeout секунд не отправили ни одной пачки (обработчик упал)
+    """
+    return PostNotification.objects.filter(
+        status=resources.notification_processing,
+        locked_at__lt=timezone.now() - timedelta(seconds=timeout),
+    ).update(status=resources.notification_pending, locked_by='')
+
+
+def record_progress(job, user_id):
+    """
+    Запоминает последнего получателя отправленной пачки и продлевает блокировку задачи,
+    чтобы долгую рассылку не сочли зависшей. Если задачу уже забрал другой обработчик, JobLost.
+    """
+    updated = PostNotification.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        last_user_id=user_id, locked_at=timezone.now())
+    if not updated:
+        raise JobLost(job.pk)
+    job.last_user_id = user_id
+
+
+def retry_delay(attempts, base_delay):
+    """
+    Экспоненциальная задержка перед повтором, не больше часа
+    """
+    return min(base_delay * 2 ** (attempts - 1), 60 * 60)
+
+
+def process_job(job, max_attempts=5, base_delay=30):
+    """
+    Рассылает уведомление. При ошибке задача откладывается с растущей задержкой,
+    после max_attempts попыток помечается как неудачная. Повтор продолжает рассылку
+    после последней отправленной пачки.
+    """
+    try:
+        send_mail_to_subscriber(job.post, job.subject, job.last_user_id,
+                                on_batch_sent=lambda user_id: record_progress(job, user_id))
+    except JobLost:
+        logger.warning('Notification %s was taken over by another worker', job.pk)
+        return False
+    except Exception:
+        job.attempts += 1
+        job.last_error = traceback.format_exc()
+        job.locked_by = ''
+        if job.attempts >= max_attempts:
+            job.status = resources.notification_failed
+            logger.error('Notification %s failed after %s attempts', job.pk, job.attempts)
+        else:
+            job.status = resources.notification_pending
+            job.available_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts, base_delay))
+            logger.warning('Notification %s failed, retry #%s at %s', job.pk, job.attempts, job.available_at)
+        job.save(update_fields=['attempts', 'last_error', 'locked_by', 'status', 'available_at'])
+        return False
+    else:
+        job.status = resources.notification_sent
+        job.locked_by = ''
+        job.save(update_fields=['status', 'locked_by'])
+        return True
@@ -0,0 +1,183 @@
+"""
+Постраничный вывод по ключу (keyset/cursor pagination).
+Вместо OFFSET и COUNT(*) следующая страница выбирается условием по ключу сортировки
+последней записи текущей страницы, поэтому любая страница стоит столько же, сколько первая.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(Http404):
+    pass
+
+
+class CursorPage:
+    """
+    Страница, полученная по курсору. Повторяет нужную шаблонам часть интерфейса django.core.paginator.Page
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    ordering: поля ключа сортировки, последним должно идти уникальное поле (обычно 'id').
+        Префикс '-' означает сортировку по убыванию.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('created', 'id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def page(self, cursor=None):
+        queryset, direction = self.page_queryset(cursor)
+        return self.build_page(list(queryset), direction, cursor)
+
+    async def apage(self, cursor=None):
+        """
+        page() для асинхронных представлений
+        """
+        queryset, direction = self.page_queryset(cursor)
+        return self.build_page([obj async for obj in queryset], direction, cursor)
+
+    def page_queryset(self, cursor=None):
+        """
+        Запрос страницы (на одну запись больше размера страницы, чтобы узнать, есть ли следующая)
+        и направление движения
+        """
+        if not cursor:
+            return self.queryset.order_by(*self.ordering)[:self.per_page + 1], NEXT
+
+        direction, values = self.decode_cursor(cursor)
+        ordering = self.ordering if direction == NEXT else self._reversed(self.ordering)
+        queryset = self.queryset.filter(self._after(ordering, values)).order_by(*ordering)
+        return queryset[:self.per_page + 1], direction
+
+    def build_page(self, rows, direction, cursor=None):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+        if not rows:
+            return CursorPage(rows)
+
+        if direction == NEXT:
+            has_next, has_previous = has_more, bool(cursor)
+        else:
+            has_next, has_previous = True, has_more
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], NEXT) if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], PREVIOUS) if has_previous else None,
+        )
+
+    def encode_cursor(self, obj, direction):
+        values = [self._value(obj, name) for name in self.fields]
+        payload = json.dumps([direction, values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(payload)
+            if direction not in (NEXT, PREVIOUS) or len(values) != len(self.fields):
+                raise ValueError(cursor)
+            return direction, [self._to_python(name, value) for name, value in zip(self.fields, values)]
+        except (ValueError, TypeError, ValidationError):
+            raise InvalidCursor('Invalid cursor')
+
+    @staticmethod
+    def _value(obj, name):
+        value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+        # DjangoJSONEncoder обрезает микросекунды, а ключу нужна точность
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    def _to_python(self, name, value):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    @staticmethod
+    def _reversed(ordering):
+        return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+
+    @staticmethod
+    def _after(ordering, values):
+        """
+        Условие «строго после ключа values» для сортировки ordering:
+        a >= x AND ((a > x) OR (a = x AND b > y) OR ...)
+        Первое условие избыточно, но позволяет базе читать индекс (a, b) диапазоном без сортировки.
+        """
+        first = ordering[0]
+        range_lookup = 'lte' if first.startswith('-') else 'gte'
+        condition = Q()
+        for i, name in enumerate(ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[i]})
+            for prev_name, prev_value in zip(ordering[:i], values[:i]):
+                step &= Q(**{prev_name.lstrip('-'): prev_value})
+            condition |= step
+        return Q(**{f'{first.lstrip("-")}__{range_lookup}': values[0]}) & condition
+
+
+class CursorPaginationMixin:
+    """
+    Подмешивается к ListView: при POSTS_CURSOR_PAGINATION страницы выбираются по курсору
+    из параметра cursor, иначе используется обычная нумерация страниц Django.
+    """
+    cursor_ordering = ('created', 'id')
+    cursor_query_param = 'cursor'
+
+    def cursor_pagination_enabled(self):
+        return getattr(settings, 'POSTS_CURSOR_PAGINATION', True)
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.cursor_pagination_enabled():
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering)
+        page = paginator.page(self.request.GET.get(self.cursor_query_param))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_pagination'] = self.cursor_pagination_enabled()
+        return context
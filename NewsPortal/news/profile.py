@@ -0,0 +1,71 @@
+"""
+Кэшируемые сведения о пользователе, которые нужны на каждой странице списков:
+состоит ли он в группе авторов и на какие категории подписан.
+Сбрасываются сигналами m2m_changed групп пользователя и подписок. Хранятся в общем кэше shared,
+чтобы сброс в одном процессе был виден всем.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+AUTHORS_GROUP = 'authors'
+
+
+class ProfileFacts:
+
+    def __init__(self, is_author=False, subscribed_categories=frozenset()):
+        self.is_author = is_author
+        self.subscribed_categories = frozenset(subscribed_categories)
+
+    def __repr__(self):
+        return f'<ProfileFacts is_author={self.is_author} subscribed={sorted(self.subscribed_categories)}>'
+
+
+def profile_facts_key(user_id):
+    return f'profile-facts:{user_id}'
+
+
+def get_profile_facts(user):
+    """
+    Сведения о пользователе из кэша; при промахе читаются из базы двумя запросами
+    """
+    if not user.is_authenticated:
+        return ProfileFacts()
+
+    key = profile_facts_key(user.pk)
+    facts = caches['shared'].get(key)
+    if facts is None:
+        from .models import SubscribersOfNews
+
+        facts = ProfileFacts(
+            is_author=user.groups.filter(name=AUTHORS_GROUP).exists(),
+            subscribed_categories=SubscribersOfNews.objects.filter(user=user).values_list('category_id', flat=True),
+        )
+        caches['shared'].set(key, facts, getattr(settings, 'PROFILE_FACTS_CACHE_TIMEOUT', 60 * 60))
+    return facts
+
+
+async def aget_profile_facts(user):
+    """
+    То же для асинхронных представлений: при промахе кэша база читается через асинхронный ORM
+    """
+    if not user.is_authenticated:
+        return ProfileFacts()
+
+    key = profile_facts_key(user.pk)
+    facts = await caches['shared'].aget(key)
+    if facts is None:
+        from .models import SubscribersOfNews
+
+        facts = ProfileFacts(
+            is_author=await user.groups.filter(name=AUTHORS_GROUP).aexists(),
+            subscribed_categories=[
+                category_id async for category_id in
+                SubscribersOfNews.objects.filter(user=user).values_list('category_id', flat=True)
+            ],
+        )
+        await caches['shared'].aset(key, facts, getattr(settings, 'PROFILE_FACTS_CACHE_TIMEOUT', 60 * 60))
+    return facts
+
+
+def invalidate_profile_facts(user_ids):
+    caches['shared'].delete_many([profile_facts_key(user_id) for user_id in user_ids])
@@ -0,0 +1,54 @@
+"""
+Ограничение числа публикаций автора: не более POST_LIMIT статей за POST_LIMIT_WINDOW секунд
+(скользящее окно). Считается индексированным запросом по (author, created).
+"""
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+_state = threading.local()
+
+
+def post_limit():
+    return getattr(settings, 'POST_LIMIT', 3)
+
+
+def post_limit_window():
+    return getattr(settings, 'POST_LIMIT_WINDOW', 24 * 60 * 60)
+
+
+@contextmanager
+def suppressed():
+    """
+    Отключает проверку в текущем потоке, например, при импорте статей
+    """
+    previous = getattr(_state, 'suppressed', False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def check_post_limit(author_id):
+    """
+    Выбрасывает ValidationError, если автор уже опубликовал допустимое число статей за окно
+    """
+    if getattr(_state, 'suppressed', False) or author_id is None:
+        return
+    from .models import Post
+
+    limit = post_limit()
+    since = timezone.now() - timedelta(seconds=post_limit_window())
+    # Считаются не больше limit строк: дальше неважно, сколько их
+    posted = Post.objects.filter(author_id=author_id, created__gte=since).order_by()[:limit].count()
+    if posted >= limit:
+        hours = post_limit_window() / 3600
+        raise ValidationError(
+            f'Не более {limit} публикаций за {hours:g} ч',
+            code='post_limit',
+        )
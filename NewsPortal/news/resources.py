@@ -8,6 +8,9 @@ POST_TYPE = [
     (post_type_news, "News"),
 ]
 
+# Вес рейтинга статьи в рейтинге автора
+post_rating_weight = 3
+
 
 def get_post_type_name(post_type):
     """
@@ -19,3 +22,18 @@ def get_post_type_name(post_type):
             result = el[1]
             break
     return result
+
+
+"""
+Состояние задачи отправки уведомлений в очереди (outbox)
+"""
+notification_pending = "PND"
+notification_processing = "PRC"
+notification_sent = "SNT"
+notification_failed = "FLD"
+NOTIFICATION_STATUS = [
+    (notification_pending, "Pending"),
+    (notification_processing, "Processing"),
+    (notification_sent, "Sent"),
+    (notification_failed, "Failed"),
+]
@@ -0,0 +1,98 @@
+"""
+Полнотекстовый поиск по статьям.
+Бэкенд задаётся настройкой POST_SEARCH_BACKEND. Индекс поддерживается сигналами post_save/post_delete
+статьи и полностью перестраивается командой rebuild_search_index.
+"""
+import abc
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q, Value, FloatField
+from django.utils.module_loading import import_string
+
+FTS_TABLE = 'news_post_fts'
+
+
+class SearchBackend(abc.ABC):
+    """
+    Интерфейс бэкенда поиска.
+    search() возвращает выборку найденных статей с аннотацией search_rank: чем меньше, тем релевантнее.
+    Бэкенд без собственного индекса переопределяет только search().
+    """
+
+    def index(self, posts):
+        pass
+
+    def remove(self, post_ids):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    @abc.abstractmethod
+    def search(self, queryset, query):
+        ...
+
+
+class LikeSearchBackend(SearchBackend):
+    """
+    Поиск подстрокой по заголовку и тексту. Индекса не требует, подходит для любой базы.
+    """
+
+    def search(self, queryset, query):
+        condition = Q()
+        for word in query.split():
+            condition &= Q(title__icontains=word) | Q(content__icontains=word)
+        return queryset.filter(condition).annotate(
+            search_rank=Value(0.0, output_field=FloatField())).order_by('search_rank', 'id')
+
+
+class SqliteFtsSearchBackend(SearchBackend):
+    """
+    Индекс SQLite FTS5 (таблица news_post_fts, rowid совпадает с id статьи).
+    Найденные статьи ранжируются по bm25.
+    """
+
+    def index(self, posts):
+        rows = [(post.pk, post.title, post.content) for post in posts]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)', rows)
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in post_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, title, content) SELECT id, title, content FROM news_post')
+            indexed = cursor.rowcount
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        return indexed
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        # Индекс присоединяется к статьям: FTS5 находит строки и ранжирует каждую один раз
+        return queryset.filter(search_index__document__match=expression).annotate(
+            search_rank=F('search_index__rank')).order_by('search_rank', 'id')
+
+    @staticmethod
+    def match_expression(query):
+        """
+        Превращает пользовательский ввод в безопасное выражение FTS5: каждое слово ищется
+        как префикс, слова объединяются через AND
+        """
+        words = re.findall(r'\w+', query)
+        return ' '.join(f'"{word}"*' for word in words)
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    return import_string(getattr(settings, 'POST_SEARCH_BACKEND', 'news.search.LikeSearchBackend'))()
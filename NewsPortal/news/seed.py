@@ -0,0 +1,178 @@
+"""
+Генерация синтетических данных портала для разработки и замеров (команда seed_portal).
+Случайные величины берутся из random.Random(seed), поэтому при одинаковых параметрах
+получаются одинаковые данные; даты отсчитываются от момента запуска.
+Строки пишутся bulk_create пачками, сигналы не отправляются: поисковый индекс
+и рейтинги авторов перестраиваются в конце.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Author, Category, Post, PostCategory, Comment, SubscribersOfNews
+from .profile import AUTHORS_GROUP
+from .search import get_search_backend
+from . import resources, timeline
+
+USERNAME_PREFIX = 'seed'
+PASSWORD = '1234567890user'
+
+WORDS = (
+    'новости спорт политика экономика наука культура погода город страна мир рынок выборы '
+    'команда матч турнир победа проект закон бюджет рост курс доллар нефть технологии '
+    'исследование открытие космос театр выставка фестиваль музыка кино книга автор '
+    'дурак редиска news sport market science world team match city report update'
+).split()
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """
+    auto_now и auto_now_add подставляют текущее время и в bulk_create, а сидеру нужны свои даты
+    """
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def chunks(total, size):
+    for start in range(0, total, size):
+        yield range(start, min(start + size, total))
+
+
+class PortalSeeder:
+    """
+    posts: число статей; остальные объёмы по умолчанию выводятся из него
+    """
+
+    def __init__(self, posts, users=None, authors=None, categories=20, comments_per_post=2,
+                 days=365, seed=0, batch_size=5000):
+        self.posts = posts
+        self.users = users or max(10, posts // 10)
+        self.authors = min(self.users, authors or max(2, self.users // 10))
+        self.categories = categories
+        self.comments_per_post = comments_per_post
+        self.days = days
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.now = timezone.now()
+        self.counts = {}
+
+    def text(self, low, high):
+        return ' '.join(self.rng.choices(WORDS, k=self.rng.randint(low, high)))
+
+    def run(self):
+        if User.objects.filter(username__startswith=f'{USERNAME_PREFIX}_').exists():
+            raise ValueError('The database is already seeded')
+
+        with transaction.atomic():
+            user_ids = self.create_users()
+            author_ids = self.create_authors(user_ids)
+            category_ids = self.create_categories()
+            self.create_subscriptions(user_ids, category_ids)
+            with explicit_dates(Post._meta.get_field('created'), Post._meta.get_field('modified'),
+                                Comment._meta.get_field('created')):
+                self.create_posts(author_ids, user_ids, category_ids)
+            Author.objects.recompute_ratings()
+            Post.objects.recount_comments()
+            Post.objects.refresh_category_labels()
+        self.counts['indexed'] = get_search_backend().rebuild()
+        self.counts['timeline'] = timeline.backfill()
+        return self.counts
+
+    def create_users(self):
+        # Хэширование пароля дорогое, у всех сгенерированных пользователей он одинаковый
+        password = make_password(PASSWORD)
+        for numbers in chunks(self.users, self.batch_size):
+            User.objects.bulk_create([
+                User(username=f'{USERNAME_PREFIX}_{i}', email=f'{USERNAME_PREFIX}_{i}@example.com', password=password)
+                for i in numbers
+            ])
+        self.counts['users'] = self.users
+        return list(User.objects.filter(username__startswith=f'{USERNAME_PREFIX}_')
+                    .order_by('pk').values_list('pk', flat=True))
+
+    def create_authors(self, user_ids):
+        author_user_ids = user_ids[:self.authors]
+        authors = Author.objects.bulk_create([Author(user_id=user_id) for user_id in author_user_ids])
+        group, _ = Group.objects.get_or_create(name=AUTHORS_GROUP)
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=user_id, group_id=group.pk) for user_id in author_user_ids
+        ])
+        self.counts['authors'] = len(authors)
+        return [author.pk for author in authors]
+
+    def create_categories(self):
+        names = [f'{USERNAME_PREFIX.title()} category {i}' for i in range(self.categories)]
+        Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+        self.counts['categories'] = self.categories
+        return list(Category.objects.filter(name__in=names).values_list('pk', flat=True))
+
+    def create_subscriptions(self, user_ids, category_ids):
+        subscriptions = [
+            SubscribersOfNews(user_id=user_id, category_id=category_id)
+            for user_id in user_ids
+            for category_id in self.rng.sample(category_ids, k=self.rng.randint(0, min(3, len(category_ids))))
+        ]
+        SubscribersOfNews.objects.bulk_create(subscriptions, batch_size=self.batch_size)
+        self.counts['subscriptions'] = len(subscriptions)
+
+    def create_posts(self, author_ids, user_ids, category_ids):
+        """
+        Статьи пачками; для каждой пачки сразу создаются их категории и комментарии
+        """
+        links = comments = 0
+        period = timedelta(days=self.days).total_seconds()
+        for numbers in chunks(self.posts, self.batch_size):
+            posts = []
+            for _ in numbers:
+                created = self.now - timedelta(seconds=self.rng.uniform(0, period))
+                posts.append(Post(
+                    author_id=self.rng.choice(author_ids),
+                    type=self.rng.choice((resources.post_type_news, resources.post_type_article)),
+                    title=self.text(3, 8).capitalize(),
+                    content=self.text(40, 120).capitalize(),
+                    rating=self.rng.randint(-5, 50),
+                    created=created,
+                    modified=created,
+                ))
+            for post in posts:
+                post.preview = post.preview_of(post.content)
+            Post.objects.bulk_create(posts)
+
+            post_categories = [
+                PostCategory(post_id=post.pk, category_id=category_id)
+                for post in posts
+                for category_id in self.rng.sample(category_ids, k=self.rng.randint(1, min(2, len(category_ids))))
+            ]
+            PostCategory.objects.bulk_create(post_categories)
+            links += len(post_categories)
+
+            post_comments = []
+            for post in posts:
+                for _ in range(self.rng.randint(0, 2 * self.comments_per_post)):
+                    post_comments.append(Comment(
+                        post_id=post.pk,
+                        user_id=self.rng.choice(user_ids),
+                        content=self.text(5, 30).capitalize(),
+                        rating=self.rng.randint(-3, 10),
+                        created=min(self.now, post.created + timedelta(seconds=self.rng.uniform(0, 7 * 24 * 3600))),
+                    ))
+            Comment.objects.bulk_create(post_comments)
+            comments += len(post_comments)
+
+        self.counts.update(posts=self.posts, post_categories=links, comments=comments)
+
+
+def seed_portal(posts, **options):
+    return PortalSeeder(posts, **options).run()
@@ -1,13 +1,14 @@
-from datetime import datetime
-from django.conf import settings
-from django.db.models.signals import post_save, pre_save
+from collections import defaultdict
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver  # импортируем нужный декоратор
-from django.template.loader import render_to_string
-from django.core.mail import EmailMultiAlternatives
-from django.utils import timezone
 from django.core.mail import send_mail
 from django.contrib.auth.models import User
-from .models import Post
+from django.utils import timezone
+from .models import Post, Comment, Author, Category, PostCategory, SubscribersOfNews
+from . import fragment_cache, notifications, ratelimit, profile, conditional, feeds, timeline
+from .search import get_search_backend
 
 
 @receiver(post_save, sender=Post)
@@ -18,48 +19,18 @@ def notify_of_post(sender, instance, created, **kwargs):
     else:
         subject = f'Post changed for {post_description}'
 
-    send_mail_to_subscriber(instance, subject)
-
-
-def send_mail_to_subscriber(post: Post, subject: str):
-    """
-    При создании новости подписчикам этой категории автоматически отправляется сообщение о пополнении в разделе.
-    """
-    domain = settings.CURRENT_HOST
-    for category in post.category.all():
-        for current_user in category.subscribers.all():
-            html_content = render_to_string(
-                'news_create_email.html',
-                {
-                    'post': post,
-                    'domain': domain,
-                }
-            ) + f'\nЗдравствуй, {current_user.username}. Новая статья в твоём любимом разделе!';
-
-            msg = EmailMultiAlternatives(
-                subject=subject,
-                body='',
-                from_email='',
-                to=[current_user.email],
-            )
-            msg.attach_alternative(html_content, "text/html")
-            msg.send()
+    # Письма рассылает команда process_notifications, а не запрос автора
+    notifications.enqueue(instance, subject)
 
 
 @receiver(pre_save, sender=Post)
 def control_of_post(sender, instance, **kwargs):
     """
-    Один пользователь не может публиковать более трёх новостей в сутки
+    Один пользователь не может публиковать более трёх новостей в сутки.
+    Проверяется только при создании статьи, редактирование не ограничено.
     """
-    today = datetime.now()
-    start = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
-    finish = datetime(today.year, today.month, today.day, 23, 59, 59, 999999, tzinfo=timezone.utc)
-
-    posted_today = Post.objects.filter(author=instance.author).filter(created__range=[start, finish])
-
-    if len(posted_today) >= 3:
-        # ToDo попытаться не выбрасывать исключение, а отменить запись
-        raise ValueError('Не более 3 новостей в день')
+    if instance._state.adding:
+        ratelimit.check_post_limit(instance.author_id)
 
 
 @receiver(post_save, sender=User)
@@ -71,3 +42,225 @@ def new_user_greetings(sender, instance: User, created, **kwargs):
             from_email='',
             recipient_list=[instance.email]
         )
+
+
+@receiver(pre_save, sender=User)
+def user_renaming(sender, instance, update_fields=None, **kwargs):
+    if not instance._state.adding and (update_fields is None or 'username' in update_fields):
+        instance._saved_username = User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, instance, created, **kwargs):
+    """
+    Имя пользователя выводится на страницах и в лентах его статей (вне кэша фрагментов):
+    после переименования меняются их время изменения, ETag списков и поколение лент
+    """
+    saved = instance.__dict__.pop('_saved_username', None)
+    if saved is not None and saved != instance.username:
+        Post.objects.filter(author__user=instance).update(modified=timezone.now())
+        conditional.mark_posts_changed()
+        feeds.invalidate()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def rating_of_created(sender, instance, created, **kwargs):
+    """
+    Рейтинг созданной статьи или комментария добавляется к рейтингу авторов
+    """
+    if created and instance.rating:
+        Author.apply_rating_deltas(sender.author_rating_deltas({instance.pk: instance.rating}))
+
+
+# Путь от модели, с которой началось удаление, к её статьям, удаляемым каскадом
+POST_CASCADE_PATHS = {Post: 'pk', Author: 'author', User: 'author__user'}
+
+
+def posts_deleted_with(origin):
+    """
+    pk статей, удаляемых вместе с origin (статьёй, автором, пользователем или их выборкой).
+    Вычисляется один раз на удаление и запоминается в origin.
+    """
+    if isinstance(origin, Post):
+        return {origin.pk}
+    if origin is None:
+        return set()
+    if '_deleted_post_ids' not in origin.__dict__:
+        is_queryset = isinstance(origin, QuerySet)
+        path = POST_CASCADE_PATHS.get(origin.model if is_queryset else type(origin))
+        if path is None:
+            post_ids = set()
+        elif is_queryset:
+            post_ids = set(Post.objects.filter(**{f'{path}__in': origin.values('pk')}).values_list('pk', flat=True))
+        else:
+            post_ids = set(Post.objects.filter(**{path: origin.pk}).values_list('pk', flat=True))
+        origin._deleted_post_ids = post_ids
+    return origin._deleted_post_ids
+
+
+@receiver(pre_delete, sender=Post)
+@receiver(pre_delete, sender=Comment)
+def rating_of_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Рейтинг удаляемой статьи или комментария вычитается из рейтинга авторов.
+    Вызывается до удаления, пока запись ещё есть в базе.
+    Рейтинг комментариев удаляемой статьи вычитается вместе с её рейтингом одним обновлением,
+    а не отдельно на каждый комментарий каскада (удаляется ли статья сама, вместе с автором
+    или с пользователем).
+    """
+    if sender is Comment and instance.post_id in posts_deleted_with(origin):
+        return
+    deltas = defaultdict(int)
+    if instance.rating:
+        deltas.update(sender.author_rating_deltas({instance.pk: -instance.rating}))
+    if sender is Post:
+        for author_id, delta in instance.comments_author_rating_deltas(-1).items():
+            deltas[author_id] += delta
+    Author.apply_rating_deltas(deltas)
+
+
+@receiver(post_save, sender=Comment)
+def comment_added(sender, instance, created, **kwargs):
+    if created:
+        Post.add_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Комментарии удаляемой статьи удаляются каскадом, её счётчик обновлять незачем
+    """
+    if instance.post_id not in posts_deleted_with(origin):
+        Post.add_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+def post_links_changed(added=(), removed=()):
+    """
+    Связи статей с категориями изменились — через post.category.add/remove/clear, в админке
+    PostCategory или каскадом. added, removed — пары (pk статьи, pk категории).
+    Поднимает редакцию статей, пересчитывает их category_labels и ленты категорий.
+    """
+    post_ids = {post_id for post_id, _ in added} | {post_id for post_id, _ in removed}
+    if not post_ids:
+        return
+    posts = Post.objects.filter(pk__in=post_ids)
+    posts.bump_revision()
+    posts.refresh_category_labels()
+    if added:
+        created = dict(posts.values_list('pk', 'created'))
+        timeline.publish([(category_id, created[post_id], post_id)
+                          for post_id, category_id in added if post_id in created])
+    if removed:
+        timeline.remove_links(removed)
+    conditional.mark_posts_changed()
+    feeds.invalidate()
+
+
+@receiver(m2m_changed, sender=PostCategory)
+def post_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    add сохраняет связи bulk_create, без post_save, поэтому добавление обрабатывается здесь.
+    remove и clear удаляют связи выборкой, они обрабатываются сигналами удаления PostCategory.
+    """
+    if action == 'post_add':
+        post_links_changed(added=[(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set])
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        instance.refresh_from_db(fields=['revision', 'category_labels'])
+
+
+@receiver(pre_save, sender=PostCategory)
+def post_link_saving(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._saved_link = (PostCategory.objects.filter(pk=instance.pk)
+                                .values_list('post_id', 'category_id').first())
+
+
+@receiver(post_save, sender=PostCategory)
+def post_link_saved(sender, instance, created, **kwargs):
+    link = (instance.post_id, instance.category_id)
+    saved = instance.__dict__.pop('_saved_link', None)
+    if created or saved != link:
+        post_links_changed(added=[link], removed=[saved] if saved else [])
+
+
+@receiver(pre_delete, sender=PostCategory)
+def post_link_deleting(sender, instance, origin=None, **kwargs):
+    """
+    Удаляемые связи копятся в объекте, с которого началось удаление, и обрабатываются
+    одним вызовом после удаления всех. Связи удаляемых статей не обрабатываются.
+    """
+    if instance.post_id not in posts_deleted_with(origin):
+        carrier = instance if origin is None else origin
+        carrier.__dict__.setdefault('_removed_links', []).append((instance.post_id, instance.category_id))
+
+
+@receiver(post_delete, sender=PostCategory)
+def post_link_deleted(sender, instance, origin=None, **kwargs):
+    carrier = instance if origin is None else origin
+    post_links_changed(removed=carrier.__dict__.pop('_removed_links', []))
+
+
+@receiver(post_save, sender=Category)
+def category_renamed(sender, instance, created, **kwargs):
+    if not created:
+        Post.objects.filter(postcategory__category=instance).refresh_category_labels()
+        Post.objects.filter(postcategory__category=instance).bump_revision()
+
+
+@receiver(post_delete, sender=Post)
+def drop_post_fragments(sender, instance, **kwargs):
+    fragment_cache.invalidate(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def posts_list_changed(sender, **kwargs):
+    conditional.mark_posts_changed()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Category)
+def feeds_changed(sender, **kwargs):
+    feeds.invalidate()
+
+
+def changed_users(instance, action, pk_set, users_of):
+    """
+    Пользователи, затронутые изменением связи «многие ко многим» с User.
+    instance — пользователь либо группа или категория; users_of(instance) возвращает
+    её пользователей (нужно для clear).
+    """
+    if isinstance(instance, User):
+        return [instance.pk]
+    if action == 'pre_clear':
+        instance._cleared_user_ids = list(users_of(instance).values_list('pk', flat=True))
+        return []
+    if action == 'post_clear':
+        return instance.__dict__.pop('_cleared_user_ids', [])
+    return pk_set or []
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        profile.invalidate_profile_facts(
+            changed_users(instance, action, pk_set, lambda group: group.user_set))
+
+
+@receiver(m2m_changed, sender=SubscribersOfNews)
+def subscriptions_changed(sender, instance, action, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        profile.invalidate_profile_facts(
+            changed_users(instance, action, pk_set, lambda category: category.subscribers))
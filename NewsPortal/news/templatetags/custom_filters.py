@@ -1,12 +1,10 @@
 from django import template
+from django.conf import settings
+from django.core.cache import cache
 
-register = template.Library()
+from news.censor import get_censor
 
-SWEAR_WORDS = [
-    'ругань1',
-    'ругань2',
-    'ругань3',
-]
+register = template.Library()
 
 
 @register.filter()
@@ -14,20 +12,22 @@ def censor(value):
     """
     Заменяет нецензурные слова на *
     """
-    res = value
-
     if type(value) == str:
-        for swear_word in SWEAR_WORDS:
-            res = res.replace(swear_word, '****')
-            res = res.replace(swear_word.capitalize(), '****')
-    return res
+        return get_censor()(value)
+    return value
 
 
 @register.filter()
-def show_categories(categories):
+def censored(post, field):
     """
-    Формирует строку из имен категорий
-    categories: post.category
+    Поле статьи (или результат метода, например preview) после цензуры.
+    Результат кэшируется по (id статьи, редакция), поэтому неизменённые статьи повторно не проверяются.
     """
-    categories_name = list(map(lambda cat: cat.name, categories.all()))
-    return ', '.join(categories_name)
+    key = f'censor:{post.pk}:{post.revision}:{field}'
+    value = cache.get(key)
+    if value is None:
+        value = getattr(post, field)
+        value = censor(value() if callable(value) else value)
+        cache.set(key, value, getattr(settings, 'CENSOR_CACHE_TIMEOUT', 24 * 60 * 60))
+    return value
+
@@ -1,6 +1,8 @@
 from datetime import datetime
 from django import template
 
+from news import fragment_cache
+
 register = template.Library()
 
 
@@ -11,7 +13,42 @@ def current_time(format_string='%b %d %Y'):
 
 @register.simple_tag(takes_context=True)
 def url_replace(context, **kwargs):
+    """
+    Текущие параметры запроса с заменой переданных. Параметр со значением None удаляется.
+    """
     params = context['request'].GET.copy()
     for k, v in kwargs.items():
-        params[k] = v
+        if v is None:
+            params.pop(k, None)
+        else:
+            params[k] = v
     return params.urlencode()
+
+
+class PostFragmentNode(template.Node):
+
+    def __init__(self, nodelist, name, post):
+        self.nodelist = nodelist
+        self.name = name
+        self.post = post
+
+    def render(self, context):
+        return fragment_cache.get_or_render(
+            self.name.resolve(context),
+            self.post.resolve(context),
+            lambda: self.nodelist.render(context),
+        )
+
+
+@register.tag('post_fragment')
+def do_post_fragment(parser, token):
+    """
+    Кэширует отрисованный фрагмент статьи по её id и редакции:
+        {% post_fragment 'post_row' post %} ... {% endpost_fragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires fragment name and post")
+    nodelist = parser.parse(('endpost_fragment',))
+    parser.delete_first_token()
+    return PostFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
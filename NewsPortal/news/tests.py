@@ -1,3 +1,1298 @@
-from django.test import TestCase
+from datetime import timedelta
+import importlib
+from io import StringIO
+import json
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.auth.models import User, Permission, Group
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command, CommandError
+from django.db import connection, transaction, IntegrityError, OperationalError
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
-# Create your tests here.
+from unittest import mock
+
+from .models import Author, Post, Comment, Category, PostCategory, PostNotification, SubscribersOfNews, TimelineEntry
+from . import resources, notifications
+from .pagination import CursorPaginator
+from .search import SearchBackend, get_search_backend
+from .censor import Censor
+from .templatetags.custom_filters import censored
+from .views import PostsList, PostsListSearch
+from .votes import vote_buffer
+from .profile import get_profile_facts
+from .seed import seed_portal
+from .transfer import export_posts, import_posts
+from .benchmarks import compare_results
+from .management.commands.sendemail import send_email_to_subscribers
+from .db import retry_on_locked
+from . import conditional, feeds, fragment_cache, metrics, timeline
+
+
+class AuthorRatingTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', 'writer@example.com')
+        self.reader = User.objects.create_user('reader', 'reader@example.com')
+        self.author = Author.objects.create(user=self.user)
+        self.reader_author = Author.objects.create(user=self.reader)
+        self.post = Post.objects.create(author=self.author, title='Title', content='Content')
+
+    def assert_ratings_consistent(self):
+        expected = {a.pk: a.rating for a in Author.objects.all()}
+        Author.objects.recompute_ratings()
+        self.assertEqual(expected, {a.pk: a.rating for a in Author.objects.all()})
+
+    def test_update_rating_single_query(self):
+        self.post.like()
+        Comment.objects.create(post=self.post, user=self.reader, rating=2)
+        Comment.objects.create(post=self.post, user=self.user, rating=5)
+        Author.objects.update(rating=0)
+
+        with self.assertNumQueries(2):
+            self.author.update_rating()
+
+        # 1 * 3 + 5 (свой комментарий) + 2 + 5 (комментарии к статьям)
+        self.assertEqual(self.author.rating, 15)
+
+    def test_incremental_rating(self):
+        self.post.like()
+        self.post.like()
+        comment = Comment.objects.create(post=self.post, user=self.reader, rating=4)
+        comment.dislike()
+        self.assert_ratings_consistent()
+        self.assertEqual(Author.objects.get(pk=self.author.pk).rating, 9)
+        self.assertEqual(Author.objects.get(pk=self.reader_author.pk).rating, 3)
+
+        comment.delete()
+        self.assert_ratings_consistent()
+        self.post.delete()
+        self.assert_ratings_consistent()
+        self.assertEqual(Author.objects.get(pk=self.author.pk).rating, 0)
+
+    def test_post_delete_cascade_queries_do_not_grow(self):
+        def delete_post_with_comments(count):
+            post = Post.objects.create(author=self.author, title='Title', content='Content')
+            post.like()
+            Comment.objects.bulk_create([
+                Comment(post=post, user=(self.reader, self.user)[i % 2], rating=i + 1) for i in range(count)
+            ])
+            Author.objects.recompute_ratings()
+            with CaptureQueriesContext(connection) as queries:
+                post.delete()
+            self.assert_ratings_consistent()
+            return len(queries)
+
+        self.assertEqual(delete_post_with_comments(10), delete_post_with_comments(100))
+        self.assertEqual(Author.objects.get(pk=self.reader_author.pk).rating, 0)
+
+    def test_author_delete_subtracts_comments_once(self):
+        Comment.objects.create(post=self.post, user=self.reader, rating=5)
+        self.author.delete()
+        self.assert_ratings_consistent()
+        self.assertEqual(Author.objects.get(pk=self.reader_author.pk).rating, 0)
+
+    def test_user_delete_subtracts_comments_once(self):
+        Comment.objects.create(post=self.post, user=self.reader, rating=5)
+        self.user.delete()
+        self.assert_ratings_consistent()
+        self.assertEqual(Author.objects.get(pk=self.reader_author.pk).rating, 0)
+
+    def test_users_queryset_delete_subtracts_comments_once(self):
+        Comment.objects.create(post=self.post, user=self.reader, rating=5)
+        Comment.objects.create(post=self.post, user=self.user, rating=2)
+        User.objects.filter(pk=self.user.pk).delete()
+        self.assert_ratings_consistent()
+        self.assertEqual(Author.objects.get(pk=self.reader_author.pk).rating, 0)
+
+    def test_recompute_command(self):
+        self.post.like()
+        Author.objects.update(rating=100)
+        call_command('recompute_ratings', stdout=StringIO())
+        self.assertEqual(Author.objects.get(pk=self.author.pk).rating, 3)
+
+
+class VoteTest(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.post = Post.objects.create(author=self.author, title='Title', content='Content')
+
+    def test_vote_updates_only_rating(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        self.post.like()
+        stale.like()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).rating, 2)
+        self.assertEqual(stale.rating, 2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.post.dislike()
+        post_updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "news_post"')]
+        self.assertEqual(len(post_updates), 1)
+        self.assertNotIn('"content"', post_updates[0])
+
+    @override_settings(VOTE_BUFFER_ENABLED=True, VOTE_BUFFER_MAX_PENDING=1000, VOTE_BUFFER_FLUSH_INTERVAL=3600)
+    def test_buffered_votes(self):
+        other = Post.objects.create(author=self.author, title='Other', content='Content')
+        for _ in range(10):
+            self.post.like()
+        other.dislike()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).rating, 0)
+
+        with self.assertNumQueries(5):
+            vote_buffer.flush()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).rating, 10)
+        self.assertEqual(Post.objects.get(pk=other.pk).rating, -1)
+        self.assertEqual(Author.objects.get(pk=self.author.pk).rating, 27)
+
+    @override_settings(VOTE_BUFFER_ENABLED=True, VOTE_BUFFER_MAX_PENDING=1000, VOTE_BUFFER_FLUSH_INTERVAL=3600)
+    def test_failed_flush_keeps_votes_counted(self):
+        self.post.like()
+        self.post.like()
+        with mock.patch.object(Post, 'apply_rating_deltas', side_effect=OperationalError('disk I/O error')), \
+                self.assertLogs('news.votes', 'ERROR'):
+            vote_buffer.flush()
+        self.assertEqual(len(vote_buffer), 1)
+        vote_buffer.flush()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).rating, 2)
+        self.assertEqual(len(vote_buffer), 0)
+
+
+class PostsListQueriesTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_post'))
+        self.client.force_login(self.user)
+
+        categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(3)])
+        authors = Author.objects.bulk_create([
+            Author(user=User.objects.create_user(f'writer{i}', f'writer{i}@example.com')) for i in range(3)
+        ])
+        posts = Post.objects.bulk_create([
+            Post(author=authors[i % 3], title=f'Title {i}', content='Content ' * 100) for i in range(30)
+        ])
+        PostCategory.objects.bulk_create([
+            PostCategory(post=post, category=category) for post in posts for category in categories[:2]
+        ])
+
+    def count_queries(self, view, url, page_size):
+        view.paginate_by = page_size
+        # Прогрев кэшей пользователя, чтобы сравнивать одинаковые условия
+        self.client.get(url)
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+        finally:
+            view.paginate_by = 3
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['posts']), page_size)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        self.assertEqual(self.count_queries(PostsList, '/portal/', 3),
+                         self.count_queries(PostsList, '/portal/', 20))
+
+    def test_search_query_count_is_constant(self):
+        self.assertEqual(self.count_queries(PostsListSearch, '/portal/search/', 3),
+                         self.count_queries(PostsListSearch, '/portal/search/', 20))
+
+
+class CursorPaginationTest(TestCase):
+
+    def setUp(self):
+        author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        Post.objects.bulk_create([Post(author=author, title=f'Title {i}') for i in range(10)])
+        # Половина статей с одинаковым временем создания: порядок внутри определяет id
+        first = Post.objects.order_by('id').first()
+        Post.objects.filter(id__lte=first.id + 4).update(created=first.created)
+        self.expected = list(Post.objects.order_by('created', 'id').values_list('id', flat=True))
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(Post.objects.all(), 3)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+
+        self.assertEqual([p.id for page in pages for p in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        page = pages[-1]
+        back = []
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            back.insert(0, [p.id for p in page])
+        self.assertEqual(back, [[p.id for p in page] for page in pages[:-1]])
+
+    def test_view_carries_filters(self):
+        user = User.objects.create_user('reader', 'reader@example.com')
+        user.user_permissions.add(Permission.objects.get(codename='view_post'))
+        self.client.force_login(user)
+
+        response = self.client.get('/portal/search/', {'title__icontains': 'title'})
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, f'title__icontains=title&amp;cursor={next_cursor}')
+
+        response = self.client.get('/portal/search/', {'title__icontains': 'title', 'cursor': next_cursor})
+        self.assertEqual([p.id for p in response.context['posts']], self.expected[3:6])
+
+        self.assertEqual(self.client.get('/portal/search/', {'cursor': 'garbage'}).status_code, 404)
+
+
+class FullTextSearchTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_post'))
+        self.client.force_login(self.user)
+        author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        other_author = Author.objects.create(user=User.objects.create_user('editor', 'editor@example.com'))
+        self.football = Post.objects.create(author=author, title='Football final', content='Match report')
+        self.weather = Post.objects.create(author=author, title='Weather', content='Rain before the football match')
+        self.politics = Post.objects.create(author=other_author, title='Elections', content='Debates')
+
+    def search(self, query):
+        response = self.client.get('/portal/search/', {'q': query})
+        return [post.pk for post in response.context['posts']]
+
+    def test_ranked_search_over_title_and_content(self):
+        self.assertEqual(self.search('football'), [self.football.pk, self.weather.pk])
+        self.assertEqual(self.search('foot'), [self.football.pk, self.weather.pk])
+        self.assertEqual(self.search('"elect'), [self.politics.pk])
+
+    def test_cursor_over_relevance(self):
+        paginator = CursorPaginator(get_search_backend().search(Post.objects.all(), 'football'), 1,
+                                    ('search_rank', 'id'))
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        self.assertEqual([first[0].pk, second[0].pk], [self.football.pk, self.weather.pk])
+        self.assertFalse(second.has_next())
+
+    def test_backend_must_implement_search(self):
+        with self.assertRaises(TypeError):
+            SearchBackend()
+
+    def test_index_follows_changes(self):
+        self.politics.content = 'Football club elections'
+        self.politics.save()
+        self.assertIn(self.politics.pk, self.search('football'))
+
+        self.weather.delete()
+        self.assertNotIn(self.weather.pk, self.search('rain'))
+        self.assertEqual(self.search('rain'), [])
+
+
+class CensorTest(TestCase):
+
+    def test_single_pass_case_insensitive(self):
+        engine = Censor(['ругань1', 'ругань', 'bad', 'b.d'])
+        self.assertEqual(engine('Ругань1, РУГАНЬ и BAD, но не b-d'), '****, **** и ****, но не b-d')
+        self.assertEqual(engine(''), '')
+        self.assertEqual(Censor([])('ругань'), 'ругань')
+
+    def test_censored_cached_per_revision(self):
+        cache.clear()
+        author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        post = Post.objects.create(author=author, title='ругань1 в заголовке', content='')
+        self.assertEqual(censored(post, 'title'), '**** в заголовке')
+
+        # Пока редакция не изменилась, берётся проверенный текст из кэша
+        post.title = 'другой заголовок'
+        self.assertEqual(censored(post, 'title'), '**** в заголовке')
+
+        post.save()
+        self.assertEqual(censored(post, 'title'), 'другой заголовок')
+
+
+class FragmentCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        fragment_cache.stats.reset()
+        user = User.objects.create_user('reader', 'reader@example.com')
+        self.client.force_login(user)
+        author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.sport = Category.objects.create(name='Sport')
+        self.post = Post.objects.create(author=author, title='Title', content='Content')
+        self.post.category.add(self.sport)
+
+    def test_rows_cached_until_post_changes(self):
+        self.client.get('/portal/')
+        self.client.get('/portal/')
+        self.assertEqual(fragment_cache.stats.snapshot()['post_row'], {'hits': 1, 'misses': 1})
+
+        Category.objects.create(name='Politics').post_set.add(self.post)
+        response = self.client.get('/portal/')
+        self.assertContains(response, 'Sport, Politics')
+
+        self.post.title = 'New title'
+        self.post.save()
+        response = self.client.get('/portal/')
+        self.assertContains(response, 'New title')
+        self.assertEqual(fragment_cache.stats.snapshot()['post_row'], {'hits': 1, 'misses': 3})
+
+    def test_stale_instance_save_gets_new_revision(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        self.post.category.remove(self.sport)
+        stale.save()
+        self.assertEqual(stale.revision, 3)
+
+    def test_author_rename_shown(self):
+        writer = self.post.author.user
+        for url in ('/portal/', f'/portal/{self.post.pk}'):
+            first = self.client.get(url)
+            self.assertContains(first, writer.username)
+            writer.username = f'renamed{len(url)}'
+            writer.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertContains(response, writer.username)
+
+    def test_counters_not_in_admin_form(self):
+        form = admin.site._registry[Post].get_form(None)
+        self.assertNotIn('revision', form.base_fields)
+        self.assertNotIn('comment_count', form.base_fields)
+
+
+class NotificationOutboxTest(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        sport = Category.objects.create(name='Sport')
+        politics = Category.objects.create(name='Politics')
+        self.reader = User.objects.create_user('reader', 'reader@example.com')
+        sport.subscribers.add(self.reader)
+        politics.subscribers.add(self.reader)
+        politics.subscribers.add(User.objects.create_user('other', 'other@example.com'))
+
+        self.post = Post.objects.create(author=self.author, title='Title', content='Content')
+        self.post.category.add(sport, politics)
+        mail.outbox.clear()
+
+    def drain(self):
+        call_command('process_notifications', once=True, workers=1, stdout=StringIO())
+
+    def test_post_save_only_enqueues(self):
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(PostNotification.objects.filter(post=self.post).count(), 1)
+
+        self.drain()
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['other@example.com', 'reader@example.com'])
+        self.assertEqual(PostNotification.objects.get().status, resources.notification_sent)
+
+    def test_retry_with_backoff(self):
+        with mock.patch('news.notifications.send_mail_to_subscriber', side_effect=ConnectionError), \
+                self.assertLogs('news.notifications', 'WARNING'):
+            self.drain()
+        job = PostNotification.objects.get()
+        self.assertEqual((job.status, job.attempts), (resources.notification_pending, 1))
+        self.assertIn('ConnectionError', job.last_error)
+
+        # Задача отложена и сразу не повторяется
+        self.drain()
+        self.assertEqual(len(mail.outbox), 0)
+
+        PostNotification.objects.update(available_at=job.created)
+        self.drain()
+        self.assertEqual(len(mail.outbox), 2)
+
+    @override_settings(NOTIFICATION_BATCH_SIZE=1)
+    def test_retry_resumes_after_sent_batches(self):
+        send_messages = mail.get_connection().send_messages
+
+        def fail_second(messages):
+            if len(mail.outbox):
+                raise ConnectionError
+            return send_messages(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=fail_second), \
+                self.assertLogs('news.notifications', 'WARNING'):
+            self.drain()
+        self.assertEqual([m.to[0] for m in mail.outbox], ['reader@example.com'])
+        self.assertEqual(PostNotification.objects.get().last_user_id, self.reader.pk)
+
+        PostNotification.objects.update(available_at=timezone.now())
+        self.drain()
+        self.assertEqual([m.to[0] for m in mail.outbox], ['reader@example.com', 'other@example.com'])
+        self.assertEqual(PostNotification.objects.get().status, resources.notification_sent)
+
+    @override_settings(NOTIFICATION_BATCH_SIZE=1)
+    def test_job_taken_over_stops_sending(self):
+        job, = notifications.claim_jobs(10)
+        send_messages = mail.get_connection().send_messages
+
+        def release_after_send(messages):
+            # Пока рассылка шла, задачу сочли зависшей и забрал другой обработчик
+            PostNotification.objects.update(locked_by='other')
+            return send_messages(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=release_after_send), \
+                self.assertLogs('news.notifications', 'WARNING'):
+            self.assertFalse(notifications.process_job(job))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(PostNotification.objects.get().locked_by, 'other')
+
+    @override_settings(NOTIFICATION_BATCH_SIZE=2)
+    def test_render_once_and_batch(self):
+        recipients = [(f'user{i}', f'user{i}@example.com') for i in range(5)]
+        with mock.patch('news.notifications.render_to_string', return_value='<p>post</p>') as render, \
+                mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                           side_effect=len) as send_messages:
+            sent = notifications.send_post_notification(self.post, 'Subject', recipients)
+        self.assertEqual(sent, 5)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual([len(call.args[0]) for call in send_messages.call_args_list], [2, 2, 1])
+
+
+class WeeklyDigestTest(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.sport = Category.objects.create(name='Sport')
+        self.politics = Category.objects.create(name='Politics')
+        self.reader = User.objects.create_user('reader', 'reader@example.com')
+        self.sport.subscribers.add(self.reader)
+        self.politics.subscribers.add(self.reader)
+        User.objects.create_user('idle', 'idle@example.com')
+
+    def publish(self, title, *categories):
+        post = Post.objects.create(author=self.author, title=title)
+        post.category.add(*categories)
+        return post
+
+    def test_one_digest_per_user_and_only_new_posts(self):
+        self.publish('Both', self.sport, self.politics)
+        self.publish('Sport only', self.sport)
+        mail.outbox.clear()
+
+        self.assertEqual(send_email_to_subscribers(), 1)
+        self.assertEqual(mail.outbox[0].to, ['reader@example.com'])
+        html = mail.outbox[0].alternatives[0][0]
+        self.assertEqual(html.count('Both'), 1)
+        self.assertIn('Sport only', html)
+
+        self.assertEqual(send_email_to_subscribers(), 0)
+
+        self.publish('Fresh', self.politics)
+        mail.outbox.clear()
+        self.assertEqual(send_email_to_subscribers(), 1)
+        html = mail.outbox[0].alternatives[0][0]
+        self.assertIn('Fresh', html)
+        self.assertNotIn('Both', html)
+
+    def test_dormant_subscriptions_not_read(self):
+        idle = User.objects.get(username='idle')
+        culture = Category.objects.create(name='Culture')
+        long_ago = timezone.now() - timedelta(days=365)
+        SubscribersOfNews.objects.create(user=idle, category=culture, last_digest_at=long_ago)
+        old = self.publish('Old', culture)
+        Post.objects.filter(pk=old.pk).update(created=long_ago - timedelta(days=1))
+        timeline.backfill()
+        self.publish('Sport only', self.sport)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(send_email_to_subscribers(), 1)
+        sql = '\n'.join(query['sql'] for query in queries)
+        self.assertIn(f'"auth_user"."id" IN ({self.reader.pk})', sql)
+        self.assertNotIn(str(long_ago.date()), sql)
+        self.assertEqual(SubscribersOfNews.objects.get(user=idle).last_digest_at, long_ago)
+
+
+class PostLimitTest(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.category = Category.objects.create(name='Sport')
+        self.posts = [Post.objects.create(author=self.author, title=f'Title {i}') for i in range(3)]
+
+    def test_limit_applies_to_new_posts_only(self):
+        self.posts[0].title = 'Edited'
+        self.posts[0].save()
+        with self.assertRaises(ValidationError):
+            Post.objects.create(author=self.author, title='One too many')
+
+    def test_create_view_shows_error(self):
+        self.client.force_login(self.author.user)
+        response = self.client.post('/portal/news/create/', {
+            'author': self.author.pk, 'category': [self.category.pk], 'title': 'One too many', 'content': 'Text',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Не более 3 публикаций за 24 ч')
+        self.assertEqual(Post.objects.count(), 3)
+
+    @override_settings(POST_LIMIT_WINDOW=60)
+    def test_window_is_configurable(self):
+        Post.objects.filter(pk__in=[p.pk for p in self.posts]).update(created=self.posts[0].created.replace(year=2020))
+        Post.objects.create(author=self.author, title='Allowed')
+
+
+class HotQueryConstraintsMigrationTest(TransactionTestCase):
+    """
+    Миграция 0007: повторы связей удаляются, затем уникальные ограничения не дают их добавить
+    """
+    before = [('news', '0006_subscribersofnews_last_digest_at')]
+    after = [('news', '0007_hot_query_indexes')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        old_apps = self.migrate(self.before)
+        self.user = old_apps.get_model('auth', 'User').objects.create(username='reader')
+        author = old_apps.get_model('news', 'Author').objects.create(user_id=self.user.pk)
+        self.category = old_apps.get_model('news', 'Category').objects.create(name='Sport')
+        self.post = old_apps.get_model('news', 'Post').objects.create(author_id=author.pk, title='Title')
+        PostCategory = old_apps.get_model('news', 'PostCategory')
+        self.links = PostCategory.objects.bulk_create(
+            [PostCategory(post_id=self.post.pk, category_id=self.category.pk) for _ in range(3)])
+        SubscribersOfNews = old_apps.get_model('news', 'SubscribersOfNews')
+        self.subscriptions = SubscribersOfNews.objects.bulk_create(
+            [SubscribersOfNews(user_id=self.user.pk, category_id=self.category.pk) for _ in range(2)])
+
+        new_apps = self.migrate(self.after)
+        self.post_categories = new_apps.get_model('news', 'PostCategory').objects
+        self.subscribers = new_apps.get_model('news', 'SubscribersOfNews').objects
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_collapse_to_earliest(self):
+        self.assertEqual(list(self.post_categories.values_list('pk', flat=True)), [self.links[0].pk])
+        self.assertEqual(list(self.subscribers.values_list('pk', flat=True)), [self.subscriptions[0].pk])
+
+    def test_new_duplicates_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.post_categories.create(post_id=self.post.pk, category_id=self.category.pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.subscribers.create(user_id=self.user.pk, category_id=self.category.pk)
+
+
+class SubscriptionTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_post'))
+        self.client.force_login(self.user)
+        self.categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(3)])
+        self.ids = [c.pk for c in self.categories]
+
+    def subscribed(self):
+        return set(SubscribersOfNews.objects.filter(user=self.user).values_list('category_id', flat=True))
+
+    def test_bulk_idempotent_subscribe(self):
+        # Сессия, пользователь, проверка категорий, один INSERT и сброс сведений в общем кэше
+        with self.assertNumQueries(5):
+            response = self.client.post('/portal/subscriptions/subscribe/', {'category': self.ids + [999, 'x']})
+        self.assertEqual(response.json(), {'categories': self.ids})
+        self.client.post('/portal/subscriptions/subscribe/', {'category': self.ids[:2]})
+        self.assertEqual(SubscribersOfNews.objects.filter(user=self.user).count(), 3)
+
+        response = self.client.post('/portal/subscriptions/unsubscribe/', {
+            'category': self.ids[:2], 'next': '/portal/search/?category=1',
+        })
+        self.assertRedirects(response, '/portal/search/?category=1', fetch_redirect_response=False)
+        self.assertEqual(self.subscribed(), {self.ids[2]})
+
+    def test_search_page_does_not_write(self):
+        self.assertEqual(self.client.get('/portal/subscriptions/subscribe/').status_code, 405)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/portal/search/', {'category': self.ids, 'subscribe': self.ids})
+        # Пишутся только сведения о пользователе в общий кэш
+        self.assertFalse([q for q in ctx.captured_queries
+                          if q['sql'].startswith(('INSERT', 'UPDATE')) and '"news_cache"' not in q['sql']])
+        self.assertContains(response, 'Подписаться на: Category 0')
+        self.assertEqual(self.subscribed(), set())
+
+
+class ProfileFactsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.group = Group.objects.create(name='authors')
+        self.category = Category.objects.create(name='Sport')
+
+    def test_cached_and_invalidated(self):
+        self.assertFalse(get_profile_facts(self.user).is_author)
+        # Одно чтение общего кэша вместо двух запросов сведений
+        with self.assertNumQueries(1):
+            get_profile_facts(self.user)
+
+        self.group.user_set.add(self.user)
+        self.assertTrue(get_profile_facts(self.user).is_author)
+
+        self.category.subscribers.add(self.user)
+        self.assertEqual(get_profile_facts(self.user).subscribed_categories, {self.category.pk})
+
+        self.user.category_set.clear()
+        self.assertEqual(get_profile_facts(self.user).subscribed_categories, set())
+
+        self.group.user_set.clear()
+        self.assertFalse(get_profile_facts(self.user).is_author)
+
+    def test_add_to_authors(self):
+        self.client.force_login(self.user)
+        self.client.get('/portal/sign/add_to_authors/')
+        self.assertTrue(get_profile_facts(self.user).is_author)
+        self.assertNotContains(self.client.get('/portal/'), 'Стать автором')
+
+        self.client.post('/portal/subscriptions/subscribe/', {'category': [self.category.pk]})
+        self.assertEqual(get_profile_facts(self.user).subscribed_categories, {self.category.pk})
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.client.force_login(self.user)
+        self.author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.post = Post.objects.create(author=self.author, title='Title', content='Content')
+        self.url = f'/portal/{self.post.pk}'
+
+    def test_change_stamps_in_shared_cache(self):
+        # Отметки пишутся в таблицу общего кэша, которую читают все процессы, а не в память процесса
+        conditional.mark_posts_changed()
+        feeds.invalidate()
+        get_profile_facts(self.user)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT cache_key FROM news_cache')
+            keys = {key for key, in cursor.fetchall()}
+        shared = caches['shared']
+        self.assertLessEqual({shared.make_key(conditional.POSTS_CHANGED_KEY), shared.make_key(feeds.GENERATION_KEY),
+                              shared.make_key(f'profile-facts:{self.user.pk}')}, keys)
+
+    def test_detail_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.post.title = 'New title'
+        self.post.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_missing_post(self):
+        self.assertEqual(self.client.get('/portal/999999', HTTP_IF_NONE_MATCH='"x"').status_code, 404)
+
+    def test_list_etag_follows_changes(self):
+        etag = self.client.get('/portal/')['ETag']
+        self.assertEqual(self.client.get('/portal/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.post.like()
+        response = self.client.get('/portal/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        Post.objects.create(author=self.author, title='Other', content='Other').delete()
+        self.assertEqual(self.client.get('/portal/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_filtered_list_etag_follows_posts_leaving_it(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='view_post'))
+        sport, politics = Category.objects.create(name='Sport'), Category.objects.create(name='Politics')
+        self.post.category.add(sport)
+        stays = Post.objects.create(author=self.author, title='Title stays', content='Content')
+        stays.category.add(sport)
+
+        for params, leave in [
+            ({'title__icontains': 'Title'}, lambda: setattr(self.post, 'title', 'Renamed') or self.post.save()),
+            ({'category': sport.pk}, lambda: self.post.category.set([politics])),
+        ]:
+            # Остающаяся статья изменена позже уходящей: последнее изменение отобранных не меняется
+            stays.save()
+            etag = self.client.get('/portal/search/', params)['ETag']
+            self.assertEqual(self.client.get('/portal/search/', params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            leave()
+            response = self.client.get('/portal/search/', params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context['posts']), [stays])
+
+
+@override_settings(ROOT_URLCONF='NewsPortal.urls_async')
+class AsyncViewsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_post'))
+        self.async_client.force_login(self.user)
+        author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.posts = Post.objects.bulk_create([
+            Post(author=author, title=f'Title {i}', content=f'Content {i}') for i in range(5)
+        ])
+
+    async def test_list_pages(self):
+        response = await self.async_client.get('/portal/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post.pk for post in response.context['posts']], [post.pk for post in self.posts[:3]])
+
+        cursor = response.context['page_obj'].next_cursor
+        response = await self.async_client.get('/portal/', {'cursor': cursor})
+        self.assertEqual([post.pk for post in response.context['posts']], [post.pk for post in self.posts[3:]])
+
+        # Заголовки AsyncClient передаются под своими HTTP-именами
+        response = await self.async_client.get('/portal/', {'cursor': cursor}, **{'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_search(self):
+        response = await self.async_client.get('/portal/search/', {'title__icontains': 'Title 4'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post.pk for post in response.context['posts']], [self.posts[4].pk])
+
+    async def test_detail(self):
+        url = f'/portal/{self.posts[0].pk}'
+        response = await self.async_client.get(url)
+        self.assertContains(response, 'Title 0')
+        response = await self.async_client.get(url, **{'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((await self.async_client.get('/portal/999999')).status_code, 404)
+
+    async def test_login_required(self):
+        self.async_client.cookies.clear()
+        response = await self.async_client.get('/portal/')
+        self.assertEqual(response.status_code, 302)
+
+
+class SeedPortalTest(TestCase):
+
+    def test_deterministic(self):
+        def snapshot():
+            return (list(Post.objects.order_by('id').values_list('title', 'author__user__username', 'rating')),
+                    list(PostCategory.objects.order_by('post_id', 'category_id').values_list('post__title', 'category__name')))
+
+        counts = seed_portal(50, batch_size=20)
+        self.assertEqual((counts['posts'], counts['users'], counts['authors']), (50, 10, 2))
+        self.assertEqual(Comment.objects.count(), counts['comments'])
+        self.assertTrue(Post.objects.filter(created__lt=timezone.now() - timedelta(days=30)).exists())
+        self.assertTrue(get_search_backend().search(Post.objects.all(), Post.objects.first().title).exists())
+        first = snapshot()
+
+        with self.assertRaises(ValueError):
+            seed_portal(50)
+
+        User.objects.filter(username__startswith='seed_').delete()
+        seed_portal(50, batch_size=20)
+        self.assertEqual(snapshot(), first)
+
+    def test_compare_benchmark_results(self):
+        baseline = {'portal': {'1000': {'paths': {'list': {'seconds': 0.01, 'queries': 7},
+                                                  'search': {'seconds': 0.1, 'queries': 8}}}}}
+        current = {'portal': {'1000': {'paths': {'list': {'seconds': 0.011, 'queries': 9},
+                                                 'search': {'seconds': 0.5, 'queries': 8}}}}}
+        self.assertEqual(compare_results(baseline, current), [
+            'portal.1000.paths.list.queries: 7 -> 9 queries',
+            'portal.1000.paths.search.seconds: 0.1 -> 0.5 s',
+        ])
+
+
+class RequestMetricsTest(TestCase):
+
+    def setUp(self):
+        metrics.registry.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.client.force_login(self.user)
+        author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        Post.objects.create(author=author, title='Title', content='Content')
+
+    def test_histograms_per_view(self):
+        self.client.get('/portal/')
+        self.client.get('/portal/')
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE news_request_duration_seconds histogram', text)
+        self.assertIn('news_request_duration_seconds_count{view="news.views.PostsList"} 2', text)
+        self.assertIn('news_request_db_queries_bucket{view="news.views.PostsList",le="+Inf"} 2', text)
+        self.assertIn('news_template_render_seconds_count{view="news.views.PostsList"} 2', text)
+
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    @override_settings(ROOT_URLCONF='NewsPortal.urls_async')
+    async def test_async_views_measured(self):
+        await self.async_client.get(f'/portal/{(await Post.objects.afirst()).pk}')
+        text = metrics.registry.render()
+        self.assertIn('news_request_db_queries_count{view="news.async_views.AsyncNewsDetail"} 1', text)
+        self.assertNotIn('news_request_db_queries_bucket{view="news.async_views.AsyncNewsDetail",le="1"} 1', text)
+        self.assertIn('news_template_render_seconds_count{view="news.async_views.AsyncNewsDetail"} 1', text)
+
+    @override_settings(REQUEST_QUERY_BUDGET=1)
+    def test_over_budget_logged_with_sql(self):
+        with self.assertLogs('news.metrics', 'WARNING') as logs:
+            self.client.get('/portal/')
+        self.assertIn('news.views.PostsList', logs.output[0])
+        self.assertIn('FROM "news_post"', logs.output[0])
+
+
+def writes(effects):
+    """
+    Запись, которая по очереди возвращает или выбрасывает effects (последний повторяется)
+    """
+    effects = effects if isinstance(effects, list) else [effects]
+
+    def save():
+        effect = effects[min(len(save.results), len(effects) - 1)]
+        save.results.append(effect)
+        if isinstance(effect, Exception):
+            raise effect
+        return effect
+
+    save.results = []
+    return save
+
+
+class SqliteSetupTest(TestCase):
+
+    def test_pragmas_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_no_retry_inside_transaction(self):
+        calls = writes(OperationalError('database is locked'))
+        with self.assertRaises(OperationalError):
+            retry_on_locked(calls)()
+        self.assertEqual(len(calls.results), 1)
+
+
+@override_settings(SQLITE_WRITE_RETRIES=2, SQLITE_WRITE_RETRY_DELAY=0)
+class RetryOnLockedTest(SimpleTestCase):
+
+    def test_retries_locked(self):
+        calls = writes([OperationalError('database is locked'), 'saved'])
+        self.assertEqual(retry_on_locked(calls)(), 'saved')
+        self.assertEqual(len(calls.results), 2)
+
+    def test_gives_up(self):
+        calls = writes(OperationalError('database is locked'))
+        with self.assertRaises(OperationalError):
+            retry_on_locked(calls)()
+        self.assertEqual(len(calls.results), 3)
+
+    def test_other_errors_not_retried(self):
+        calls = writes(OperationalError('no such table: news_post'))
+        with self.assertRaises(OperationalError):
+            retry_on_locked(calls)()
+        self.assertEqual(len(calls.results), 1)
+
+
+class PostTransferTest(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        sport = Category.objects.create(name='Sport')
+        science = Category.objects.create(name='Science')
+        self.post = Post.objects.create(author=self.author, title='Match', content='Победа команды', rating=2)
+        self.post.category.set([sport, science])
+        Post.objects.filter(pk=self.post.pk).update(created=timezone.now() - timedelta(days=30))
+        Post.objects.create(author=self.author, title='Empty', type=resources.post_type_article)
+        PostNotification.objects.all().delete()
+
+    def export(self, format):
+        stream = StringIO()
+        self.assertEqual(export_posts(stream, format, chunk_size=1), 2)
+        stream.seek(0)
+        return stream
+
+    def assert_copied(self):
+        copy = Post.objects.exclude(pk__lte=self.post.pk + 1).get(title='Match')
+        self.assertEqual(copy.created, Post.objects.get(pk=self.post.pk).created)
+        self.assertEqual(copy.rating, 2)
+        self.assertEqual(sorted(copy.category.values_list('name', flat=True)), ['Science', 'Sport'])
+        self.assertEqual(Post.objects.filter(type=resources.post_type_article).count(), 2)
+        return copy
+
+    def test_jsonl_round_trip(self):
+        stream = self.export('jsonl')
+        row = json.loads(stream.getvalue().splitlines()[0])
+        self.assertEqual((row['author'], row['categories']), ('writer', ['Sport', 'Science']))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(import_posts(stream, 'jsonl', batch_size=10), 2)
+        # Вместе с записью двух отметок изменений в общий кэш (по 5 запросов)
+        self.assertLess(len(queries), 30)
+        copy = self.assert_copied()
+        self.assertTrue(get_search_backend().search(Post.objects.filter(pk=copy.pk), 'победа').exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.rating, 2 * 2 * resources.post_rating_weight)
+        # Без сигналов подписчики не уведомляются
+        self.assertFalse(PostNotification.objects.exists())
+
+    def test_csv_with_signals(self):
+        stream = self.export('csv')
+        self.assertEqual(import_posts(stream, 'csv', send_signals=True), 2)
+        self.assert_copied()
+        self.assertEqual(PostNotification.objects.count(), 2)
+
+    def test_unknown_author(self):
+        stream = StringIO(json.dumps({'author': 'nobody', 'title': 'Title'}) + '\n')
+        with self.assertRaisesMessage(ValueError, "Row 1: unknown author 'nobody'"):
+            import_posts(stream)
+
+    def test_rate_limit_requires_signals(self):
+        with self.assertRaisesMessage(CommandError, '--rate-limit requires --signals'):
+            call_command('import_posts', '-', rate_limit=True, stdout=StringIO())
+        with self.assertRaises(ValueError):
+            import_posts(self.export('jsonl'), rate_limit=True)
+
+
+class FeedsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.sport = Category.objects.create(name='Sport')
+        self.sport_post = Post.objects.create(author=author, title='Match', content='Победа команды')
+        self.sport_post.category.add(self.sport)
+        Post.objects.create(author=author, title='Weather', content='Дождь')
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_global_and_category_feeds(self):
+        text = self.content(self.client.get('/portal/feeds/rss/'))
+        self.assertIn('<title>Match</title>', text)
+        self.assertIn('<title>Weather</title>', text)
+        self.assertIn('<category>Sport</category>', text)
+
+        response = self.client.get(f'/portal/feeds/{self.sport.pk}/atom/')
+        self.assertEqual(response['Content-Type'], 'application/atom+xml; charset=utf-8')
+        text = self.content(response)
+        self.assertIn('<title>Match</title>', text)
+        self.assertNotIn('Weather', text)
+
+        self.assertEqual(self.client.get('/portal/feeds/999/rss/').status_code, 404)
+
+    def test_censored(self):
+        self.sport_post.title = 'ругань1 в заголовке'
+        self.sport_post.content = 'Текст с ругань2'
+        self.sport_post.save()
+        for url in ('/portal/feeds/rss/', '/portal/feeds/atom/'):
+            text = self.content(self.client.get(url))
+            self.assertIn('**** в заголовке', text)
+            self.assertIn('Текст с ****', text)
+            self.assertNotIn('ругань', text)
+
+    def test_cached_until_posts_change(self):
+        first = self.client.get('/portal/feeds/rss/')
+        text = self.content(first)
+        # Одно чтение поколения лент из общего кэша на запрос
+        with self.assertNumQueries(2):
+            self.assertEqual(self.content(self.client.get('/portal/feeds/rss/')), text)
+            response = self.client.get('/portal/feeds/rss/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.sport_post.title = 'Final'
+        self.sport_post.save()
+        response = self.client.get('/portal/feeds/rss/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('<title>Final</title>', self.content(response))
+
+
+@override_settings(POST_LIMIT=10)
+class JsonApiTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_post'))
+        self.client.force_login(self.user)
+        author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.sport = Category.objects.create(name='Sport')
+        self.posts = [Post.objects.create(author=author, title=f'Post {i}', content='Победа ' * 40) for i in range(5)]
+        self.posts[0].category.add(self.sport)
+        Comment.objects.create(post=self.posts[0], user=self.user, content='First')
+        Comment.objects.create(post=self.posts[0], user=self.user, content='Second')
+
+    def test_posts_pages_and_fields(self):
+        with self.assertNumQueries(4):  # сессия, пользователь, статьи, категории
+            data = self.client.get('/portal/api/posts/', {'limit': 3}).json()
+        self.assertEqual([row['title'] for row in data['results']], ['Post 4', 'Post 3', 'Post 2'])
+        self.assertEqual(set(data['results'][0]), {'id', 'type', 'title', 'author', 'rating', 'comment_count',
+                                                   'created', 'preview', 'categories'})
+        self.assertEqual(data['results'][0]['author'], 'writer')
+        self.assertTrue(data['results'][0]['preview'].endswith('...'))
+
+        data = self.client.get('/portal/api/posts/', {'limit': 3, 'cursor': data['next'], 'fields': 'id,title'}).json()
+        self.assertEqual(data['results'], [{'id': self.posts[1].pk, 'title': 'Post 1'},
+                                           {'id': self.posts[0].pk, 'title': 'Post 0'}])
+        self.assertIsNone(data['next'])
+
+        response = self.client.get('/portal/api/posts/', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['detail'])
+
+    def test_text_censored(self):
+        post = self.posts[0]
+        post.title = 'ругань1 в заголовке'
+        post.content = 'Текст с ругань2'
+        post.save()
+        Comment.objects.create(post=post, user=self.user, content='ругань3!')
+        rows = [
+            self.client.get('/portal/api/posts/', {'fields': 'id,title,preview,content'}).json()['results'][-1],
+            self.client.get(f'/portal/api/posts/{post.pk}/').json(),
+        ]
+        for row in rows:
+            self.assertEqual(row['title'], '**** в заголовке')
+            self.assertEqual(row['content'], 'Текст с ****')
+        self.assertEqual(rows[0]['preview'], 'Текст с ****')
+        comments = self.client.get(f'/portal/api/posts/{post.pk}/comments/').json()['results']
+        self.assertEqual(comments[-1]['content'], '****!')
+
+    def test_filters(self):
+        data = self.client.get('/portal/api/posts/', {'category': self.sport.pk, 'fields': 'title,categories'}).json()
+        self.assertEqual(data['results'], [{'title': 'Post 0', 'categories': [{'id': self.sport.pk, 'name': 'Sport'}]}])
+        data = self.client.get('/portal/api/posts/', {'q': 'победа', 'limit': 2, 'fields': 'id'}).json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNotNone(data['next'])
+
+        self.user.user_permissions.clear()
+        self.user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(self.client.get('/portal/api/posts/', {'category': self.sport.pk}).status_code, 403)
+
+    def test_detail_comments_and_categories(self):
+        post = self.posts[0]
+        data = self.client.get(f'/portal/api/posts/{post.pk}/').json()
+        self.assertEqual(data['content'], post.content)
+        self.assertEqual(data['categories'], [{'id': self.sport.pk, 'name': 'Sport'}])
+        self.assertEqual(self.client.get('/portal/api/posts/999/').status_code, 404)
+
+        data = self.client.get(f'/portal/api/posts/{post.pk}/comments/', {'fields': 'user,content'}).json()
+        self.assertEqual(data['results'], [{'user': 'reader', 'content': 'First'},
+                                           {'user': 'reader', 'content': 'Second'}])
+        self.assertEqual(self.client.get('/portal/api/categories/').json(),
+                         {'results': [{'id': self.sport.pk, 'name': 'Sport'}]})
+
+        self.client.logout()
+        self.assertEqual(self.client.get('/portal/api/posts/').status_code, 401)
+
+
+@override_settings(POST_LIMIT=20)
+class TimelineTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.client.force_login(self.user)
+        author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.sport, self.science, self.culture = (Category.objects.create(name=name)
+                                                  for name in ('Sport', 'Science', 'Culture'))
+        now = timezone.now()
+        self.posts = []
+        for i, categories in enumerate([[self.sport], [self.science], [self.sport, self.science],
+                                        [self.culture], [self.sport], [self.science]]):
+            post = Post.objects.create(author=author, title=f'Post {i}')
+            Post.objects.filter(pk=post.pk).update(created=now - timedelta(hours=10 - i))
+            post.refresh_from_db()
+            post.category.set(categories)
+            self.posts.append(post)
+        SubscribersOfNews.objects.create(user=self.user, category=self.sport)
+        SubscribersOfNews.objects.create(user=self.user, category=self.science)
+
+    def titles(self, page):
+        return [post.title for post in page.object_list]
+
+    def test_merges_subscribed_categories(self):
+        first = timeline.page([self.sport.pk, self.science.pk], 3)
+        self.assertEqual(self.titles(first), ['Post 5', 'Post 4', 'Post 2'])
+        second = timeline.page([self.sport.pk, self.science.pk], 3, first.next_cursor)
+        # Статья из двух категорий выводится один раз
+        self.assertEqual(self.titles(second), ['Post 1', 'Post 0'])
+        self.assertIsNone(second.next_cursor)
+
+    def test_follows_category_changes(self):
+        self.posts[3].category.add(self.sport)
+        self.posts[5].category.remove(self.science)
+        self.sport.post_set.remove(self.posts[4])
+        self.posts[0].delete()
+        self.assertEqual(self.titles(timeline.page([self.sport.pk, self.science.pk], 10)),
+                         ['Post 3', 'Post 2', 'Post 1'])
+
+    @override_settings(TIMELINE_RETENTION=2)
+    def test_retention_and_backfill(self):
+        TimelineEntry.objects.all().delete()
+        self.assertEqual(timeline.backfill(), 5)
+        self.assertEqual(self.titles(timeline.page([self.science.pk], 10)), ['Post 5', 'Post 2'])
+        self.posts[4].category.add(self.science)
+        self.assertEqual(self.titles(timeline.page([self.science.pk], 10)), ['Post 5', 'Post 4'])
+
+    @override_settings(TIMELINE_RETENTION=2)
+    def test_migration_fills_timelines(self):
+        TimelineEntry.objects.all().delete()
+        migration = importlib.import_module('news.migrations.0010_timelineentry')
+        migration.fill_timelines(apps, None)
+        self.assertEqual(TimelineEntry.objects.count(), 5)
+        self.assertEqual(self.titles(timeline.page([self.sport.pk, self.science.pk], 10)),
+                         ['Post 5', 'Post 4', 'Post 2'])
+
+    def test_view(self):
+        get_profile_facts(self.user)
+        # Сведения о пользователе читаются из общего кэша одним запросом
+        with self.assertNumQueries(6):
+            response = self.client.get('/portal/my/')
+        self.assertEqual(self.titles(response.context['page_obj']),
+                         ['Post 5', 'Post 4', 'Post 2', 'Post 1', 'Post 0'])
+
+
+class CommentCountTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.client.force_login(self.user)
+        self.author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.post = Post.objects.create(author=self.author, title='Title', content='Content')
+
+    def comment(self, n=1):
+        return [Comment.objects.create(post=self.post, user=self.user, content=f'Comment {i}') for i in range(n)]
+
+    def test_count_follows_comments(self):
+        first, second = self.comment(2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+        first.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_post_delete_cascades_without_updates(self):
+        self.comment(3)
+        with CaptureQueriesContext(connection) as queries:
+            self.post.delete()
+        self.assertFalse([q for q in queries if 'comment_count' in q['sql']])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_recount(self):
+        self.comment(3)
+        Post.objects.update(comment_count=0)
+        Post.objects.recount_comments()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+
+    def test_detail_pages_comments(self):
+        self.comment(25)
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/portal/{self.post.pk}')
+        comments = response.context['comments']
+        self.assertEqual([c.content for c in comments][:2], ['Comment 0', 'Comment 1'])
+        self.assertEqual(len(comments), 20)
+        self.assertContains(response, 'Комментарии: 25')
+
+        response = self.client.get(f'/portal/{self.post.pk}', {'comments': comments.next_cursor})
+        self.assertEqual([c.content for c in response.context['comments']], [f'Comment {i}' for i in range(20, 25)])
+        # Число запросов не зависит от числа комментариев
+        self.comment(50)
+        with self.assertNumQueries(3):
+            self.client.get(f'/portal/{self.post.pk}')
+
+    def test_etag_depends_on_comment_page(self):
+        self.comment(25)
+        first = self.client.get(f'/portal/{self.post.pk}')
+        cursor = first.context['comments'].next_cursor
+        second = self.client.get(f'/portal/{self.post.pk}', {'comments': cursor})
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(self.client.get(f'/portal/{self.post.pk}', {'comments': cursor},
+                                         HTTP_IF_NONE_MATCH=second['ETag']).status_code, 304)
+        self.comment()
+        self.assertEqual(self.client.get(f'/portal/{self.post.pk}', {'comments': cursor},
+                                         HTTP_IF_NONE_MATCH=second['ETag']).status_code, 200)
+
+    @override_settings(ROOT_URLCONF='NewsPortal.urls_async')
+    async def test_async_detail_pages_comments(self):
+        await Comment.objects.acreate(post=self.post, user=self.user, content='Async comment')
+        response = await self.async_client.get(f'/portal/{self.post.pk}')
+        self.assertEqual([c.content for c in response.context['comments']], ['Async comment'])
+
+
+class StoredPreviewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com')
+        self.client.force_login(self.user)
+        self.author = Author.objects.create(user=User.objects.create_user('writer', 'writer@example.com'))
+        self.sport = Category.objects.create(name='Sport')
+        self.politics = Category.objects.create(name='Politics')
+        self.post = Post.objects.create(author=self.author, title='Title', content='Long text ' * 100)
+
+    def test_preview_saved_with_content(self):
+        self.assertEqual(self.post.preview, Post.preview_of(self.post.content))
+        self.assertTrue(self.post.preview.endswith('...'))
+        self.post.content = 'Short text'
+        self.post.save(update_fields=['content'])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.preview, 'Short text')
+
+    def test_labels_follow_categories(self):
+        def labels():
+            return Post.objects.values_list('category_labels', flat=True).get(pk=self.post.pk)
+
+        self.post.category.add(self.sport, self.politics)
+        self.assertEqual(self.post.category_labels, 'Sport, Politics')
+        self.post.category.remove(self.sport)
+        self.assertEqual(labels(), 'Politics')
+        self.sport.post_set.add(self.post)
+        self.assertEqual(labels(), 'Politics, Sport')
+        self.politics.name = 'World'
+        self.politics.save()
+        self.assertEqual(labels(), 'World, Sport')
+        self.sport.post_set.clear()
+        self.assertEqual(labels(), 'World')
+        self.post.category.clear()
+        self.assertEqual(labels(), '')
+
+    def test_links_saved_directly(self):
+        # Так связи меняет админка PostCategory: без m2m_changed
+        def state():
+            return (Post.objects.values_list('category_labels', 'revision').get(pk=self.post.pk),
+                    set(TimelineEntry.objects.values_list('category_id', 'post_id')))
+
+        link = PostCategory.objects.create(post=self.post, category=self.sport)
+        self.assertEqual(state(), (('Sport', 1), {(self.sport.pk, self.post.pk)}))
+        link.category = self.politics
+        link.save()
+        self.assertEqual(state(), (('Politics', 2), {(self.politics.pk, self.post.pk)}))
+        PostCategory.objects.create(post=self.post, category=self.sport)
+        link.delete()
+        self.assertEqual(state(), (('Sport', 4), {(self.sport.pk, self.post.pk)}))
+        PostCategory.objects.filter(post=self.post).delete()
+        self.assertEqual(state(), (('', 5), set()))
+
+    def test_category_delete_drops_labels(self):
+        self.post.category.add(self.sport, self.politics)
+        self.sport.delete()
+        self.assertEqual(Post.objects.values_list('category_labels', flat=True).get(pk=self.post.pk), 'Politics')
+
+    def test_list_does_not_read_content(self):
+        self.post.category.add(self.sport)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/portal/')
+        self.assertContains(response, self.post.preview)
+        self.assertContains(response, 'Sport')
+        self.assertFalse([q for q in queries if '"news_post"."content"' in q['sql']])
+
+    def test_import_and_backfill(self):
+        self.sport.delete()
+        import_posts(StringIO(json.dumps({'author': 'writer', 'title': 'Imported', 'content': 'Text ' * 50,
+                                          'categories': ['Sport', 'Politics']}) + '\n'))
+        imported = Post.objects.get(title='Imported')
+        self.assertEqual((imported.preview, imported.category_labels),
+                         (Post.preview_of(imported.content), 'Sport, Politics'))
+
+        Post.objects.update(preview='', category_labels='')
+        migration = importlib.import_module('news.migrations.0012_post_preview_category_labels')
+        migration.fill_previews_and_labels(apps, None)
+        self.assertEqual([(post.preview, post.category_labels) for post in Post.objects.order_by('pk')],
+                         [(Post.preview_of(self.post.content), ''), (imported.preview, 'Sport, Politics')])
@@ -0,0 +1,125 @@
+"""
+Ленты категорий (TimelineEntry), записываемые при публикации (fan-out on write).
+Статья, добавленная в категорию, попадает в её ленту; в ленте остаётся не больше
+TIMELINE_RETENTION последних статей. Лента подписок пользователя собирается слиянием
+отсортированных лент его категорий: по одному запросу диапазоном индекса на категорию.
+"""
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Post, PostCategory, TimelineEntry
+from .pagination import CursorPage, CursorPaginator, InvalidCursor, NEXT
+
+ORDERING = ('-created', '-post_id')
+
+
+def retention():
+    return getattr(settings, 'TIMELINE_RETENTION', 1000)
+
+
+def publish(entries):
+    """
+    Добавляет записи (категория, время создания, статья) в ленты и обрезает эти ленты
+    """
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(category_id=category_id, created=created, post_id=post_id)
+         for category_id, created, post_id in entries],
+        ignore_conflicts=True,
+    )
+    trim({category_id for category_id, _, _ in entries})
+
+
+def publish_posts(post_ids, category_ids):
+    """
+    Добавляет статьи post_ids в ленты категорий category_ids
+    """
+    created = Post.objects.filter(pk__in=post_ids).values_list('pk', 'created')
+    publish([(category_id, date, post_id) for post_id, date in created for category_id in category_ids])
+
+
+def remove(post_ids=None, category_ids=None):
+    entries = TimelineEntry.objects.all()
+    if post_ids is not None:
+        entries = entries.filter(post_id__in=post_ids)
+    if category_ids is not None:
+        entries = entries.filter(category_id__in=category_ids)
+    entries.delete()
+
+
+def remove_links(links):
+    """
+    Убирает статьи из лент категорий по парам (статья, категория), по запросу на категорию
+    """
+    post_ids = defaultdict(set)
+    for post_id, category_id in links:
+        post_ids[category_id].add(post_id)
+    for category_id, ids in post_ids.items():
+        TimelineEntry.objects.filter(category_id=category_id, post_id__in=ids).delete()
+
+
+def trim(category_ids):
+    """
+    Удаляет из лент категорий записи старше TIMELINE_RETENTION последних
+    """
+    for category_id in category_ids:
+        entries = TimelineEntry.objects.filter(category_id=category_id)
+        boundary = entries.order_by(*ORDERING).values_list('created', 'post_id')[retention():retention() + 1].first()
+        if boundary:
+            created, post_id = boundary
+            entries.filter(Q(created__lt=created) | Q(created=created, post_id__lte=post_id)).delete()
+
+
+def backfill():
+    """
+    Заполняет ленты заново по связям статей с категориями, возвращает число записей
+    """
+    TimelineEntry.objects.all().delete()
+    total = 0
+    category_ids = PostCategory.objects.order_by().values_list('category_id', flat=True).distinct()
+    for category_id in list(category_ids):
+        links = (PostCategory.objects.filter(category_id=category_id)
+                 .order_by('-post__created', '-post_id')
+                 .values_list('post__created', 'post_id')[:retention()])
+        entries = TimelineEntry.objects.bulk_create([
+            TimelineEntry(category_id=category_id, created=created, post_id=post_id) for created, post_id in links
+        ])
+        total += len(entries)
+    return total
+
+
+def page(category_ids, per_page, cursor=None):
+    """
+    Страница ленты подписок по категориям category_ids от новых статей к старым (статьи выбираются
+    for_list) с курсором следующей.
+    Каждая лента читается на per_page + 1 записей, поэтому первые per_page + 1 разных статей
+    слияния точны, даже если статья есть в нескольких категориях.
+    """
+    runs = []
+    for category_id in sorted(category_ids):
+        paginator = CursorPaginator(
+            TimelineEntry.objects.filter(category_id=category_id).values('created', 'post_id'), per_page, ORDERING)
+        if cursor:
+            direction, _ = paginator.decode_cursor(cursor)
+            if direction != NEXT:
+                raise InvalidCursor('Invalid cursor')
+        queryset, _ = paginator.page_queryset(cursor)
+        runs.append(list(queryset))
+
+    rows, seen = [], set()
+    for row in heapq.merge(*runs, key=lambda row: (row['created'], row['post_id']), reverse=True):
+        if row['post_id'] not in seen:
+            seen.add(row['post_id'])
+            rows.append(row)
+        if len(rows) > per_page:
+            break
+
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = Post.objects.for_list().in_bulk([row['post_id'] for row in rows])
+    return CursorPage(
+        [posts[row['post_id']] for row in rows if row['post_id'] in posts],
+        next_cursor=paginator.encode_cursor(rows[-1], NEXT) if has_next else None,
+    )
@@ -0,0 +1,225 @@
+"""
+Выгрузка и загрузка статей в JSONL или CSV (команды export_posts и import_posts).
+Обе стороны идут потоком: статьи читаются iterator(chunk_size) и пишутся пачками,
+поэтому память не зависит от числа статей.
+Строка: id, author (имя пользователя-автора), type, title, content, rating, created
+и categories (названия; в CSV через «|»). При загрузке id не сохраняется, статьи получают новые.
+"""
+import csv
+import json
+import time
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .db import retry_on_locked
+from .models import Author, Category, Post, PostCategory
+from .search import get_search_backend
+from .seed import explicit_dates
+from . import conditional, feeds, ratelimit, resources, timeline
+
+FORMATS = ('jsonl', 'csv')
+FIELDS = ('id', 'author', 'type', 'title', 'content', 'rating', 'created', 'categories')
+CSV_LIST_SEPARATOR = '|'
+
+
+def guess_format(path, default='jsonl'):
+    extension = str(path).rpartition('.')[2].lower()
+    return extension if extension in FORMATS else default
+
+
+class Progress:
+    """
+    Вызывает callback(обработано, секунд с начала) после каждых every строк и в конце
+    """
+
+    def __init__(self, callback, every):
+        self.callback = callback
+        self.every = every
+        self.count = 0
+        self.started = time.perf_counter()
+
+    def add(self, count=1):
+        before = self.count
+        self.count += count
+        if self.callback and before // self.every != self.count // self.every:
+            self.callback(self.count, self.seconds())
+
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def done(self):
+        if self.callback and (self.count % self.every or not self.count):
+            self.callback(self.count, self.seconds())
+        return self.count
+
+
+def post_row(post):
+    return {
+        'id': post.pk,
+        'author': post.author.user.username,
+        'type': post.type,
+        'title': post.title,
+        'content': post.content,
+        'rating': post.rating,
+        'created': post.created.isoformat(),
+        'categories': [category.name for category in post.category.all()],
+    }
+
+
+def export_posts(stream, format='jsonl', chunk_size=2000, queryset=None, progress=None):
+    """
+    Пишет статьи queryset (по умолчанию все) в текстовый поток stream, возвращает их число
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    posts = queryset.order_by('pk').select_related('author__user').prefetch_related('category')
+    if format == 'csv':
+        writer = csv.DictWriter(stream, FIELDS)
+        writer.writeheader()
+
+        def write(row):
+            writer.writerow({**row, 'categories': CSV_LIST_SEPARATOR.join(row['categories'])})
+    else:
+        def write(row):
+            stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    counter = Progress(progress, chunk_size)
+    for post in posts.iterator(chunk_size=chunk_size):
+        write(post_row(post))
+        counter.add()
+    return counter.done()
+
+
+def read_rows(stream, format='jsonl'):
+    if format == 'csv':
+        for row in csv.DictReader(stream):
+            row['categories'] = [name for name in (row.get('categories') or '').split(CSV_LIST_SEPARATOR) if name]
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class PostImporter:
+    """
+    По умолчанию статьи пачками пишутся bulk_create: сигналы (письма подписчикам, ограничение
+    числа публикаций) не отправляются, поисковый индекс, ленты, названия категорий статей
+    и рейтинги авторов обновляются для пачки.
+    send_signals: каждая статья сохраняется отдельно со всеми сигналами, ограничение числа
+    публикаций проверяется, только если rate_limit.
+    Каждая пачка — своя транзакция: при ошибке в строке уже загруженные пачки остаются.
+    """
+
+    def __init__(self, batch_size=1000, send_signals=False, rate_limit=False):
+        if rate_limit and not send_signals:
+            raise ValueError('rate_limit requires send_signals: batches are saved without the post limit check')
+        self.batch_size = batch_size
+        self.send_signals = send_signals
+        self.rate_limit = rate_limit
+        self.authors = dict(Author.objects.values_list('user__username', 'pk'))
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        self.types = dict(resources.POST_TYPE)
+
+    def run(self, rows, progress=None):
+        counter = Progress(progress, self.batch_size)
+        line = 1
+        for batch in batches(rows, self.batch_size):
+            posts = [self.make_post(row, line + i) for i, row in enumerate(batch)]
+            line += len(batch)
+            self.create_categories(batch)
+            categories = [[self.categories[name] for name in row.get('categories') or ()] for row in batch]
+            if self.send_signals:
+                self.save_one_by_one(posts, categories)
+            else:
+                self.save_batch(posts, categories)
+            counter.add(len(posts))
+        return counter.done()
+
+    def make_post(self, row, line):
+        author_id = self.authors.get(row.get('author'))
+        if author_id is None:
+            raise ValueError(f'Row {line}: unknown author {row.get("author")!r}')
+        post_type = row.get('type') or resources.post_type_news
+        if post_type not in self.types:
+            raise ValueError(f'Row {line}: unknown post type {post_type!r}')
+        created = row.get('created')
+        if created and not isinstance(created, datetime):
+            created = parse_datetime(created)
+            if created is None:
+                raise ValueError(f'Row {line}: invalid created date {row["created"]!r}')
+        if created and timezone.is_naive(created):
+            created = timezone.make_aware(created)
+        return Post(
+            author_id=author_id,
+            type=post_type,
+            title=row.get('title') or '',
+            content=row.get('content') or '',
+            rating=int(row.get('rating') or 0),
+            created=created or timezone.now(),
+        )
+
+    def create_categories(self, batch):
+        names = {name for row in batch for name in row.get('categories') or () if name not in self.categories}
+        if names:
+            Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(name__in=names).values_list('name', 'pk'))
+
+    @retry_on_locked
+    def save_batch(self, posts, categories):
+        # Время изменения — момент загрузки (auto_now), чтобы сменились ETag списков
+        with transaction.atomic(), explicit_dates(Post._meta.get_field('created')):
+            for post in posts:
+                post.pk = None
+                post.preview = post.preview_of(post.content)
+            Post.objects.bulk_create(posts)
+            PostCategory.objects.bulk_create([
+                PostCategory(post_id=post.pk, category_id=category_id)
+                for post, category_ids in zip(posts, categories)
+                for category_id in category_ids
+            ], ignore_conflicts=True)
+            Post.objects.filter(pk__in=[post.pk for post in posts]).refresh_category_labels()
+            get_search_backend().index(posts)
+            timeline.publish([
+                (category_id, post.created, post.pk)
+                for post, category_ids in zip(posts, categories)
+                for category_id in category_ids
+            ])
+            Author.apply_rating_deltas(Post.author_rating_deltas({post.pk: post.rating for post in posts}))
+        # bulk_create не отправляет сигналов, по которым обновляются ленты и ETag списков
+        feeds.invalidate()
+        conditional.mark_posts_changed()
+
+    @retry_on_locked
+    def save_one_by_one(self, posts, categories):
+        with transaction.atomic(), explicit_dates(Post._meta.get_field('created')):
+            for post, category_ids in zip(posts, categories):
+                post.pk = None
+                post._state.adding = True
+                if self.rate_limit:
+                    post.save()
+                else:
+                    with ratelimit.suppressed():
+                        post.save()
+                post.category.add(*category_ids)
+
+
+def import_posts(stream, format='jsonl', batch_size=1000, send_signals=False, rate_limit=False, progress=None):
+    """
+    Загружает статьи из текстового потока stream, возвращает их число
+    """
+    return PostImporter(batch_size, send_signals, rate_limit).run(read_rows(stream, format), progress)
@@ -1,11 +1,16 @@
 from django.urls import path
-from .views import PostsList, PostsListSearch, NewsDetail, PostCreate, PostEdit, PostDelete
+from .views import PostsList, PostsListSearch, NewsDetail, PostCreate, PostEdit, PostDelete, fragment_cache_stats, \
+   subscribe, unsubscribe, SubscriptionFeed
+from .feeds import PostsFeed, PostsAtomFeed
+from . import api
 
 urlpatterns = [
 
    path('', PostsList.as_view(), name='post_list'),
    path('search/', PostsListSearch.as_view()),
    path('<int:id>', NewsDetail.as_view(), name='post_detail'),
+   # Лента подписок
+   path('my/', SubscriptionFeed.as_view(), name='subscription_feed'),
    # News create
    path('news/create/', PostCreate.as_view(), name='news_create'),
    # Article create
@@ -18,4 +23,19 @@ urlpatterns = [
    path('news/<int:pk>/delete/', PostDelete.as_view(), name='post_delete'),
    # Article delete
    path('article/<int:pk>/delete/', PostDelete.as_view(), name='post_delete'),
+   # Подписка на категории и отписка
+   path('subscriptions/subscribe/', subscribe, name='subscribe'),
+   path('subscriptions/unsubscribe/', unsubscribe, name='unsubscribe'),
+   # Ленты RSS и Atom, общие и по категориям
+   path('feeds/rss/', PostsFeed(), name='posts_rss'),
+   path('feeds/atom/', PostsAtomFeed(), name='posts_atom'),
+   path('feeds/<int:category_id>/rss/', PostsFeed(), name='category_rss'),
+   path('feeds/<int:category_id>/atom/', PostsAtomFeed(), name='category_atom'),
+   # JSON API только для чтения
+   path('api/posts/', api.posts, name='api_posts'),
+   path('api/posts/<int:id>/', api.post_detail, name='api_post_detail'),
+   path('api/posts/<int:id>/comments/', api.post_comments, name='api_post_comments'),
+   path('api/categories/', api.categories, name='api_categories'),
+   # Статистика кэша фрагментов
+   path('cache-stats/', fragment_cache_stats, name='fragment_cache_stats'),
 ]
@@ -0,0 +1,9 @@
+from django.urls import path
+from .async_views import AsyncPostsList, AsyncPostsListSearch, AsyncNewsDetail
+
+# Асинхронные страницы чтения; остальные адреса портала берутся из news.urls (см. NewsPortal.urls_async)
+urlpatterns = [
+   path('', AsyncPostsList.as_view(), name='post_list'),
+   path('search/', AsyncPostsListSearch.as_view()),
+   path('<int:id>', AsyncNewsDetail.as_view(), name='post_detail'),
+]
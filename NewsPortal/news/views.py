@@ -1,14 +1,28 @@
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
 from django.urls import reverse_lazy
+from django.db import transaction
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from django.http import JsonResponse, HttpResponse
+from django.shortcuts import redirect
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
+from django.contrib.auth.decorators import login_required
 from django.http.request import QueryDict
-from .models import Post, Category, User
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.utils.decorators import method_decorator
+from .models import Post, Category, User, SubscribersOfNews
 from .filters import PostFilter
 from .forms import PostCreateForm
-from . import resources
+from .pagination import CursorPaginationMixin, CursorPaginator
+from .conditional import ConditionalListMixin, post_condition
+from .profile import get_profile_facts, invalidate_profile_facts
+from .db import retry_on_locked
+from . import resources, fragment_cache, metrics, timeline
 
 
-class PostsList(LoginRequiredMixin, ListView):
+class PostsList(LoginRequiredMixin, ConditionalListMixin, CursorPaginationMixin, ListView):
     model = Post
     ordering = 'created'
     template_name = 'news_all.html'
@@ -16,13 +30,16 @@ class PostsList(LoginRequiredMixin, ListView):
     # Paginating
     paginate_by = 3
 
+    def get_queryset(self):
+        return super().get_queryset().for_list()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['is_not_premium'] = not self.request.user.groups.filter(name='authors').exists()
+        context['is_not_premium'] = not get_profile_facts(self.request.user).is_author
         return context
 
 
-class PostsListSearch(PermissionRequiredMixin, ListView):
+class PostsListSearch(PermissionRequiredMixin, ConditionalListMixin, CursorPaginationMixin, ListView):
     permission_required = ('news.view_post',)
     model = Post
     ordering = 'created'
@@ -30,49 +47,84 @@ class PostsListSearch(PermissionRequiredMixin, ListView):
     context_object_name = 'posts'
     paginate_by = 3
 
-    def get(self, request, *args, **kwargs):
-        self.subscribe_to_category()
-        return super().get(request, *args, **kwargs)
-
-    def subscribe_to_category(self):
-        """
-        Оформляет подписку на категорию
-        """
-        cat_to_sub = list(map(int, self.request.GET.getlist('subscribe')))
-        for cat_sub_id in cat_to_sub:
-            cat = Category.objects.get(id=cat_sub_id)
-            cat.subscribers.add(self.request.user)
-            cat.save()
-
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().for_list()
         self.filterset = PostFilter(self.request.GET, queryset)
+        if self.filterset.is_valid() and self.filterset.form.cleaned_data.get('q'):
+            # Результаты поиска идут по релевантности
+            self.cursor_ordering = ('search_rank', 'id')
         return self.filterset.qs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['filterset'] = self.filterset
         context['current_user'] = self.request.user
-        context['cat_not_sub'] = self.categories_not_sub(self.request.GET, self.request.user)
+        context['cat_not_sub'], context['cat_sub'] = self.categories_by_subscription(
+            self.request.GET, self.request.user)
 
         return context
 
     @staticmethod
-    def categories_not_sub(get_params: QueryDict, user: User):
+    def categories_by_subscription(get_params: QueryDict, user: User):
         """
-        Категории из фильтра, на которые пользователь не подписан
+        Категории из фильтра, на которые пользователь не подписан, и на которые подписан.
+        Подписки берутся из кэша, из базы читаются только названия категорий фильтра.
         """
-        cat_filter = map(int, get_params.getlist('category'))
-        cat_not_sub = Category.objects.filter(id__in=cat_filter).exclude(subscribers__id=user.id)
-        return cat_not_sub
+        cat_filter = category_ids(get_params)
+        if not cat_filter:
+            return [], []
+        subscribed = get_profile_facts(user).subscribed_categories
+        categories = Category.objects.filter(id__in=cat_filter).order_by('id')
+        return ([cat for cat in categories if cat.id not in subscribed],
+                [cat for cat in categories if cat.id in subscribed])
+
+
+class SubscriptionFeed(LoginRequiredMixin, TemplateView):
+    """
+    Статьи категорий, на которые подписан пользователь, от новых к старым (лента из news.timeline)
+    """
+    template_name = 'news_all.html'
+    paginate_by = 10
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        facts = get_profile_facts(self.request.user)
+        page = timeline.page(facts.subscribed_categories, self.paginate_by, self.request.GET.get('cursor'))
+        context.update(
+            posts=page.object_list,
+            page_obj=page,
+            is_paginated=page.has_other_pages(),
+            cursor_pagination=True,
+            is_not_premium=not facts.is_author,
+        )
+        return context
 
 
+@method_decorator(post_condition, name='dispatch')
 class NewsDetail(DetailView):
     model = Post
     template_name = 'news.html'
     context_object_name = 'post'
     # Определяет, как будем называть первичный ключ при определении url
     pk_url_kwarg = 'id'
+    comments_per_page = 20
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('author__user')
+
+    def get_context_data(self, **kwargs):
+        """
+        Добавляет страницу комментариев по курсору из параметра comments: стоимость не зависит
+        от их общего числа
+        """
+        context = super().get_context_data(**kwargs)
+        context['comments'] = comments_paginator(self.object, self.comments_per_page).page(
+            self.request.GET.get('comments'))
+        return context
+
+
+def comments_paginator(post, per_page):
+    return CursorPaginator(post.comment_set.select_related('user'), per_page, ('created', 'id'))
 
 
 def get_post_type(request_path):
@@ -106,8 +158,16 @@ class PostCreate(CreateView):
         """
         post = form.save(commit=False)
         post.type = get_post_type(self.request.path)['short']
+        return self.save_post(form)
 
-        return super().form_valid(form)
+    @retry_on_locked
+    def save_post(self, form):
+        # После отката неудачной попытки статья снова новая
+        form.instance.pk = None
+        form.instance._state.adding = True
+        # Статья, её категории и задача уведомления подписчиков записываются вместе
+        with transaction.atomic():
+            return super().form_valid(form)
 
 
 class PostEdit(LoginRequiredMixin, UpdateView):
@@ -133,6 +193,11 @@ class PostEdit(LoginRequiredMixin, UpdateView):
         context['post_pk'] = f'{self.object.id}'
         return context
 
+    @retry_on_locked
+    def form_valid(self, form):
+        with transaction.atomic():
+            return super().form_valid(form)
+
 
 class PostDelete(DeleteView):
     """ Удаление новости или статьи """
@@ -157,3 +222,68 @@ class PostDelete(DeleteView):
         context['post_type'] = f'{post_type["name"]}'
         context['post_pk'] = f'{self.object.id}'
         return context
+
+
+def category_ids(params: QueryDict):
+    """
+    Номера категорий из параметров category, нечисловые значения пропускаются
+    """
+    return {int(value) for value in params.getlist('category') if value.isdigit()}
+
+
+def subscriptions_response(request, category_ids):
+    """
+    Возврат на страницу из параметра next, либо JSON с номерами обработанных категорий
+    """
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+        return redirect(next_url)
+    return JsonResponse({'categories': sorted(category_ids)})
+
+
+@login_required
+@require_POST
+@retry_on_locked
+def subscribe(request):
+    """
+    Подписывает пользователя на категории из параметров category одним INSERT.
+    Повторная подписка ничего не меняет.
+    """
+    ids = set(Category.objects.filter(id__in=category_ids(request.POST)).values_list('id', flat=True))
+    SubscribersOfNews.objects.bulk_create(
+        [SubscribersOfNews(category_id=cat_id, user=request.user) for cat_id in ids],
+        ignore_conflicts=True,
+    )
+    # bulk_create не отправляет m2m_changed
+    invalidate_profile_facts([request.user.pk])
+    return subscriptions_response(request, ids)
+
+
+@login_required
+@require_POST
+@retry_on_locked
+def unsubscribe(request):
+    """
+    Отписывает пользователя от категорий из параметров category одним DELETE
+    """
+    ids = category_ids(request.POST)
+    SubscribersOfNews.objects.filter(user=request.user, category_id__in=ids).delete()
+    invalidate_profile_facts([request.user.pk])
+    return subscriptions_response(request, ids)
+
+
+@staff_member_required
+def fragment_cache_stats(request):
+    """
+    Попадания и промахи кэша фрагментов статей в этом процессе
+    """
+    return JsonResponse(fragment_cache.stats.snapshot())
+
+
+def metrics_view(request):
+    """
+    Гистограммы запросов в текстовом формате Prometheus. Доступны сотрудникам и адресам из INTERNAL_IPS
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,99 @@
+"""
+Буфер голосов (like/dislike).
+Голоса копятся в памяти процесса, суммируются по объектам и записываются в базу пачкой:
+по достижении порога VOTE_BUFFER_MAX_PENDING голосов или раз в VOTE_BUFFER_FLUSH_INTERVAL секунд.
+Включается настройкой VOTE_BUFFER_ENABLED.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._count = 0
+        self._last_flush = time.monotonic()
+        self._flusher = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'VOTE_BUFFER_ENABLED', False)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'VOTE_BUFFER_MAX_PENDING', 500)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'VOTE_BUFFER_FLUSH_INTERVAL', 5)
+
+    def __len__(self):
+        return self._count
+
+    def add(self, model, pk, delta):
+        """
+        Запоминает голос за объект модели model с первичным ключом pk
+        """
+        with self._lock:
+            self._pending[model][pk] += delta
+            self._count += 1
+            due = (self._count >= self.max_pending
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        self._start_flusher()
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Записывает накопленные приращения рейтинга: по одному UPDATE ... CASE на модель
+        """
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+            self._count = 0
+            self._last_flush = time.monotonic()
+
+        for model, deltas in pending.items():
+            deltas = {pk: delta for pk, delta in deltas.items() if delta}
+            if not deltas:
+                continue
+            try:
+                model.apply_rating_deltas(deltas)
+            except Exception:
+                logger.exception('Failed to flush %s votes of %s, keeping them', len(deltas), model.__name__)
+                with self._lock:
+                    for pk, delta in deltas.items():
+                        self._pending[model][pk] += delta
+                    # Иначе фоновый поток сочтёт буфер пустым и не повторит запись
+                    self._count += len(deltas)
+
+    def _start_flusher(self):
+        """
+        Запускает фоновый поток, сбрасывающий буфер по интервалу, даже если новых голосов нет
+        """
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, name='vote-buffer', daemon=True)
+                self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._count:
+                close_old_connections()
+                self.flush()
+
+
+vote_buffer = VoteBuffer()
+atexit.register(vote_buffer.flush)